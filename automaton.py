@@ -17,12 +17,45 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 from inspect import getsource, getcomments
+from struct import pack
+from zlib import crc32
+from hashlib import sha1
 
-from grammar import read_grammar, Conflicts, Unique
+from grammar import read_grammar, digraph, Conflicts, Unique
+from helpers import Stats
 import template
 from text import split_it, write_block
 from version import VERSION
 
+# increase this when the layout of `Automaton.cache_data` changes
+CACHE_FORMAT = 1
+
+
+class StateIndex(object):
+
+    """Labels for the states of an automaton.
+
+    The final state numbers are only assigned after all states have
+    been generated.  Labels are hashed by the number `serial` given
+    at construction, so that sets of labels are processed in the same
+    order in every run of the program.
+    """
+
+    def __init__(self, serial):
+        self.label = -1
+        self.serial = serial
+
+    def __hash__(self):
+        return self.serial
+
+    def set_label(self, label):
+        self.label = label
+
+    def __int__(self):
+        return self.label
+
+    def __repr__(self):
+        return str(self.label)
 
 class Automaton(object):
 
@@ -35,9 +68,20 @@ class Automaton(object):
         LR(1) conflicts in the grammar.  The value should be a
         dictionary with production rule indices as keys and lists of
         overrides as values.
+
+        `params["method"]` selects the construction method for the
+        parser tables: "lr1" (the default) uses the algorithm of
+        Pager, 1977, which accepts all LR(1) grammars, "lalr"
+        constructs LALR(1) tables.
+
+        If `params["stats"]` is a `Stats` object, timings and
+        counters for the generation of the tables are recorded there.
         """
         self.g = g
         self.overrides = params.get("overrides", {})
+        self.method = params.get("method", "lr1")
+        self.stats = params.get("stats") or Stats()
+        self.closure_calls = 0
 
         self.replace_nonterminals = params.get("replace_nonterminals", False)
         nonterminals = sorted(self.g.nonterminals-set([self.g.start]))
@@ -70,70 +114,228 @@ class Automaton(object):
                     return False
         return True
 
-    def _closure(self, U):
+    def _number_items(self):
+        """Intern items and lookahead symbols for table generation.
+
+        Items (production rules with a dot) are numbered in the order
+        of the tuples `(key,l,n)`, so that comparing item numbers
+        gives the same result as comparing the tuples, and so that
+        `i+1` is the item obtained by moving the dot in item `i` one
+        position to the right.  Sets of lookahead symbols are
+        represented as integer bitmasks, with one bit per terminal
+        symbol.
+
+        For every item, `self.item_info` stores `None` if no symbol
+        follows the dot.  Otherwise it stores a tuple `(X, first,
+        nullable, start)`, where `X` is the symbol after the dot,
+        `first` is the mask of all possible first terminals in the
+        rest of the rule after `X`, `nullable` tells whether this rest
+        can be empty, and `start` is the list of all items with the
+        dot at the beginning of a rule for `X`.
+        """
         rules = self.g.rules
-        first_tokens = self.g.first_tokens
-        rule_from_head = self.g.rule_from_head
 
-        todo = U.copy()
+        self.lookaheads = sorted(self.g.terminals)
+        self.lookahead_bit = dict((X,1<<i)
+                                  for i,X in enumerate(self.lookaheads))
+
+        items = []
+        for key,r in rules.iteritems():
+            l = len(r)
+            for n in range(1, l+1):
+                items.append((key,l,n))
+        items.sort()
+        self.items = items
+        self.item_id = dict((item,i) for i,item in enumerate(items))
+        self.core_closures = {}
+        self.nonterminal_closures = {}
+        self.lookahead_sets = {}
+
+        bit = self.lookahead_bit
+        info = []
+        for key,l,n in items:
+            if n == l:
+                info.append(None)
+                continue
+            r = rules[key]
+            tail = r[n+1:]
+            first = 0
+            for Y in self.g.first_tokens(tail):
+                first |= bit[Y]
+            start = [ self.item_id[(k,m,1)]
+                      for k,m in self.g.rule_from_head[r[n]] ]
+            info.append((r[n], first, self.g.is_nullable(tail), start))
+        self.item_info = info
+
+    def _lookahead_set(self, mask):
+        """Convert a bitmask of lookahead symbols into a set.
+
+        The same masks occur many times in the tables, so the results
+        are cached.  Every call returns a new set.
+        """
+        res = self.lookahead_sets.get(mask)
+        if res is None:
+            key = mask
+            res = []
+            i = 0
+            while mask:
+                if mask & 1:
+                    res.append(self.lookaheads[i])
+                mask >>= 1
+                i += 1
+            res = frozenset(res)
+            self.lookahead_sets[key] = res
+        return set(res)
+
+    def _closure(self, U):
+        """Compute the closure of a set of items.
+
+        `U` is a dictionary, mapping item numbers to bitmasks of
+        lookahead symbols.  The result has the same form.
+
+        Which items are in the closure, and which kernel items pass
+        their lookaheads on to them, only depends on the core of `U`.
+        This information is computed once for every core, see
+        `_core_closure`, so that only the lookahead masks need to be
+        combined here.
+        """
+        self.closure_calls += 1
+        core = frozenset(U)
+        links = self.core_closures.get(core)
+        if links is None:
+            links = self._core_closure(core)
+            self.core_closures[core] = links
+
         res = {}
-        for prod in todo:
-            res[prod] = todo[prod].copy()
+        for sources,entries in links:
+            ctx = 0
+            for k in sources:
+                ctx |= U[k]
+            if ctx:
+                for item,mask in entries:
+                    res[item] = mask | ctx
+            else:
+                res.update(entries)
+        return res
+
+    def _core_closure(self, core):
+        """Compute the closure of a core, with lookahead propagation links.
+
+        The result is a list of pairs `(sources, entries)`, where
+        `sources` is a tuple of kernel items and `entries` is a list
+        of pairs `(item, spontaneous)`.  The lookaheads of `item` are
+        the mask `spontaneous` of lookaheads generated inside the
+        closure, together with the lookaheads of all kernel items in
+        `sources`.
+        """
+        info = self.item_info
+        res = dict((k,[0,[k]]) for k in core)
+        for k in core:
+            i = info[k]
+            if i is None:
+                continue
+            X, first, nullable, start = i
+            for item,mask,propagates in self._nonterminal_closure(X):
+                entry = res.get(item)
+                if entry is None:
+                    entry = res[item] = [0,[]]
+                if propagates:
+                    mask |= first
+                    if nullable:
+                        entry[1].append(k)
+                entry[0] |= mask
+        groups = {}
+        for item,(mask,sources) in res.iteritems():
+            groups.setdefault(tuple(sources), []).append((item,mask))
+        return groups.items()
+
+    def _nonterminal_closure(self, X):
+        """Compute the items which are started by a dot before `X`.
+
+        The result is a list of tuples `(item, spontaneous,
+        propagates)`, where `spontaneous` is the mask of lookaheads
+        generated inside the closure and `propagates` tells whether
+        the lookaheads following `X` are passed on to `item`.  The
+        result is computed only once for every symbol.
+        """
+        res = self.nonterminal_closures.get(X)
+        if res is not None:
+            return res
+
+        info = self.item_info
+        # an extra bit marks the lookaheads following X
+        marker = 1<<len(self.lookaheads)
+        rule_from_head = self.g.rule_from_head
+        todo = dict((self.item_id[(k,m,1)],marker)
+                    for k,m in rule_from_head[X])
+        closure = todo.copy()
         while todo:
-            prod,ctx = todo.popitem()
-            key,l,n = prod
-            if n == l:
+            item,ctx = todo.popitem()
+            i = info[item]
+            if i is None:
                 continue
-            rule = rules[key]
-            tail = list(rule[n+1:])
-            new_rules = [ ((k,l,1),res.setdefault((k,l,1), set()))
-                          for k,l in rule_from_head[rule[n]] ]
-            for X in ctx:
-                lookahead = first_tokens(tail+[X])
-                for prod,res_ctx in new_rules:
-                    new = lookahead - res_ctx
-                    if new:
-                        todo_ctx = todo.setdefault(prod, set())
-                        todo_ctx |= new
-                        res_ctx |= new
+            Y, first, nullable, start = i
+            if nullable:
+                lookahead = first | ctx
+            else:
+                lookahead = first
+            for item in start:
+                old = closure.get(item, 0)
+                new = lookahead & ~old
+                if new:
+                    closure[item] = old | new
+                    todo[item] = todo.get(item, 0) | new
+
+        res = [ (item,mask & ~marker,bool(mask & marker))
+                for item,mask in sorted(closure.iteritems()) ]
+        self.nonterminal_closures[X] = res
         return res
 
     def _generate_tables(self):
-        """This implements the algorithm of Pager, 1977."""
+        """Generate the states and transitions of the automaton."""
         if self.tables_generated:
             return
+        self.stats.start("generate_tables")
+        if self.method == "lalr":
+            self._generate_lalr_tables()
+        else:
+            self._generate_lr1_tables()
+        self.stats.stop("generate_tables")
+        self.stats.set("states", len(self.states))
+        self.tables_generated = True
 
-        class StateIndex(object):
-
-            def __init__(self):
-                self.label = -1
-
-            def set_label(self, label):
-                self.label = label
-
-            def __int__(self):
-                return self.label
-
-            def __repr__(self):
-                return str(self.label)
+    def _generate_lr1_tables(self):
+        """This implements the algorithm of Pager, 1977.
 
-        rules = self.g.rules
+        Only states with the same core, i.e. with the same set of
+        kernel items, can be merged.  Therefore, the existing states
+        are indexed by their core and a new state is only checked for
+        compatibility with the states in its own index entry.
+        """
+        self._number_items()
+        items = self.items
+        info = self.item_info
 
         state_tab = {}
-        self.initial_state = StateIndex()
+        self.initial_state = StateIndex(0)
         key, l = self.g.rule_from_head[self.g.start][0]
-        state_tab[self.initial_state] = { (key,l,1): set([self.g.EOF]) }
+        state_tab[self.initial_state] = {
+            self.item_id[(key,l,1)]: self.lookahead_bit[self.g.EOF]
+        }
 
+        # maps each core to the list of states with this core
         maybe_compatible = {}
-        for X in self.g.symbols:
-            maybe_compatible[X] = set()
 
         todo = set([self.initial_state])
         done = set()
 
         reduce_tab = {}
         shift_tab = {}
+        closure_tab = {}
 
+        created = 1
+        merged = 0
+        regenerated = 0
         while todo:
             state_no = todo.pop()
             done.add(state_no)
@@ -142,34 +344,32 @@ class Automaton(object):
             stab = shift_tab.setdefault(state_no,{})
 
             state = self._closure(state_tab[state_no])
+            closure_tab[state_no] = state
             shift = {}
-            for prod,ctx in state.iteritems():
-                key,l,n = prod
-                r = rules[key]
-                if n == l:
+            for item,ctx in state.iteritems():
+                i = info[item]
+                if i is None:
                     # reduce using rule 'key'
-                    rtab[key] = ctx
+                    rtab[items[item][0]] = ctx
                 else:
-                    # shift symbol r[n]
-                    X = r[n]
-                    p = (key,l,n+1)
-
-                    X_neighbour = shift.setdefault(X, {})
-                    neighbour_ctx = X_neighbour.setdefault(p, set())
-                    neighbour_ctx.update(ctx)
+                    # shift symbol i[0]
+                    X_neighbour = shift.setdefault(i[0], {})
+                    X_neighbour[item+1] = X_neighbour.get(item+1, 0) | ctx
 
             for X,S in shift.iteritems():
-                for Tn in maybe_compatible[X]:
+                core = frozenset(S)
+                for Tn in maybe_compatible.get(core, ()):
                     T = state_tab[Tn]
                     if not self._is_compatible(S, T):
                         continue
                     # merge S into T
                     stab[X] = Tn
+                    merged += 1
                     changed = False
-                    for prod in S:
-                        add = S[prod] - T[prod]
+                    for item in S:
+                        add = S[item] & ~T[item]
                         if add:
-                            T[prod] |= add
+                            T[item] |= add
                             changed = True
                     if changed and Tn in done:
                         # regenerate the neighbours of T as needed
@@ -177,13 +377,15 @@ class Automaton(object):
                         del shift_tab[Tn]
                         del reduce_tab[Tn]
                         todo.add(Tn)
+                        regenerated += 1
                     break
                 else:
                     # create a new state for S
-                    next_state = StateIndex()
+                    next_state = StateIndex(created)
+                    created += 1
                     stab[X] = next_state
                     state_tab[next_state] = S
-                    maybe_compatible[X].add(next_state)
+                    maybe_compatible.setdefault(core, []).append(next_state)
                     todo.add(next_state)
                     if X == self.g.EOF:
                         self.halting_state = next_state
@@ -196,10 +398,19 @@ class Automaton(object):
             n = todo.pop()
             used_states.add(n)
             todo.update(set(shift_tab[n].values())-used_states)
-        for s in set(state_tab.keys())-used_states:
+        unused = set(state_tab.keys())-used_states
+        for s in unused:
             del state_tab[s]
             del reduce_tab[s]
             del shift_tab[s]
+            del closure_tab[s]
+
+        stats = self.stats
+        stats.set("states_created", created)
+        stats.set("states_merged", merged)
+        stats.set("states_regenerated", regenerated)
+        stats.set("states_unused", len(unused))
+        stats.set("closure_cores", len(self.core_closures))
 
         keyfn = lambda x: (x == self.halting_state,min(state_tab[x]))
         states = sorted(used_states, key=keyfn)
@@ -207,16 +418,160 @@ class Automaton(object):
             s.set_label(k)
         assert repr(self.initial_state) == "0"
 
+        # convert back from item numbers and bitmasks
+        def convert(U):
+            return dict((items[item],self._lookahead_set(ctx))
+                        for item,ctx in U.iteritems())
         self.states = states
-        self.state_tab = state_tab
-        self.reduce_tab = reduce_tab
+        self.state_tab = {}
+        self.reduce_tab = {}
+        for state in states:
+            self.state_tab[state] = convert(state_tab[state])
+            self.reduce_tab[state] = dict(
+                (key,self._lookahead_set(ctx))
+                for key,ctx in reduce_tab[state].iteritems())
+        self.closure_masks = closure_tab
+        self.closure_tab = {}
         self.shift_tab = shift_tab
+        stats.set("closure_calls", self.closure_calls)
 
-        self.closure_tab = {}
-        for state in states:
-            self.closure_tab[state] = self._closure(self.state_tab[state])
+    def _generate_lalr_tables(self):
+        """Generate LALR(1) tables.
 
-        self.tables_generated = True
+        This first constructs the LR(0) automaton and then computes
+        the lookahead sets using the relations from DeRemer and
+        Pennello, 1982.
+        """
+        self._number_items()
+        items = self.items
+        info = self.item_info
+        bit = self.lookahead_bit
+        rules = self.g.rules
+        nullable = self.g.nullable
+        nonterminals = self.g.nonterminals
+
+        # the LR(0) automaton
+        key, l = self.g.rule_from_head[self.g.start][0]
+        start_rule = rules[key]
+        start_item = self.item_id[(key,l,1)]
+        kernels = [ frozenset([start_item]) ]
+        kernel_idx = { kernels[0]: 0 }
+        closures = []
+        goto = []
+        while len(goto) < len(kernels):
+            U = set(kernels[len(goto)])
+            todo = list(U)
+            while todo:
+                i = info[todo.pop()]
+                if i is None:
+                    continue
+                for item in i[3]:
+                    if item not in U:
+                        U.add(item)
+                        todo.append(item)
+            closures.append(U)
+            succ = {}
+            for item in U:
+                i = info[item]
+                if i is not None:
+                    succ.setdefault(i[0], []).append(item+1)
+            trans = {}
+            for X,S in succ.iteritems():
+                S = frozenset(S)
+                if S not in kernel_idx:
+                    kernel_idx[S] = len(kernels)
+                    kernels.append(S)
+                trans[X] = kernel_idx[S]
+            goto.append(trans)
+        self.stats.set("states_created", len(kernels))
+        self.stats.set("closure_calls", len(closures))
+
+        # nonterminal transitions, the starting point for the lookaheads
+        nt_trans = []
+        for p,trans in enumerate(goto):
+            for X in trans:
+                if X in nonterminals:
+                    nt_trans.append((p,X))
+        nt_idx = dict((t,k) for k,t in enumerate(nt_trans))
+
+        # direct reads and the "reads" relation
+        DR = []
+        reads = []
+        for p,A in nt_trans:
+            r = goto[p][A]
+            mask = 0
+            rr = []
+            for X,q in goto[r].iteritems():
+                if X in nonterminals:
+                    if X in nullable:
+                        rr.append(nt_idx[(r,X)])
+                else:
+                    mask |= bit[X]
+            DR.append(mask)
+            reads.append(rr)
+        digraph(reads, DR)
+        read_sets = DR
+
+        # the "includes" relation, and the paths through the automaton
+        # along the right-hand sides of production rules
+        includes = [ [] for t in nt_trans ]
+        paths = []
+        for t,(p0,B) in enumerate(nt_trans):
+            for k,l in self.g.rule_from_head[B]:
+                rhs = rules[k][1:]
+                p = p0
+                path = [ p ]
+                for i,X in enumerate(rhs):
+                    if X in nonterminals and self.g.is_nullable(rhs[i+1:]):
+                        includes[nt_idx[(p,X)]].append(t)
+                    p = goto[p][X]
+                    path.append(p)
+                paths.append((t, self.item_id[(k,l,1)], path))
+        digraph(includes, read_sets)
+        follow = read_sets
+
+        # Lookahead sets for all items: for an item in state q, this
+        # is the union of the follow sets of all transitions (p,B)
+        # such that the rule was started in state p and q is reached
+        # from p by reading the part of the rule before the dot.
+        ctx = [ {} for U in closures ]
+        for t,item,path in paths:
+            mask = follow[t]
+            for p in path:
+                ctx[p][item] = ctx[p].get(item, 0) | mask
+                item += 1
+        p = 0
+        for X in start_rule[1:]:
+            ctx[p][start_item] = bit[self.g.EOF]
+            start_item += 1
+            p = goto[p][X]
+        ctx[p][start_item] = bit[self.g.EOF]
+        halting = p
+
+        states = [ StateIndex(k) for k in range(0, len(kernels)) ]
+        self.initial_state = states[0]
+        self.halting_state = states[halting]
+        self.state_tab = {}
+        self.closure_masks = {}
+        self.closure_tab = {}
+        self.reduce_tab = {}
+        self.shift_tab = {}
+        for k,state in enumerate(states):
+            self.closure_masks[state] = ctx[k]
+            self.state_tab[state] = dict(
+                (items[item],self._lookahead_set(ctx[k][item]))
+                for item in kernels[k])
+            self.reduce_tab[state] = dict(
+                (items[item][0],self._lookahead_set(c))
+                for item,c in ctx[k].iteritems() if info[item] is None)
+            self.shift_tab[state] = dict(
+                (X,states[q]) for X,q in goto[k].iteritems())
+
+        keyfn = lambda k: (k == halting, sorted(kernels[k]))
+        order = sorted(range(0, len(states)), key=keyfn)
+        for label, k in enumerate(order):
+            states[k].set_label(label)
+        self.states = [ states[k] for k in order ]
 
     def _get_actions(self, state, X):
         """Get the neighbours of a node in the automaton's state graph.
@@ -250,10 +605,26 @@ class Automaton(object):
             res.setdefault(X, []).append(('S',next_state))
         return res
 
+    def _state_closure(self, state):
+        """Return the closure of a state.
+
+        The result maps items to sets of lookahead symbols.  It is
+        only needed to describe conflicts and for debugging output, so
+        it is converted from the bitmasks in `self.closure_masks` on
+        demand.
+        """
+        res = self.closure_tab.get(state)
+        if res is None:
+            items = self.items
+            res = dict((items[item],self._lookahead_set(ctx))
+                       for item,ctx in self.closure_masks[state].iteritems())
+            self.closure_tab[state] = res
+        return res
+
     def _check_overrides(self, state, X, action):
         rules = self.g.rules
         if action[0] == 'S':
-            for k,l,n in self.closure_tab[state]:
+            for k,l,n in self._state_closure(state):
                 if n == l or rules[k][n] != X:
                     continue
                 if n not in self.overrides.get(k, []):
@@ -272,6 +643,7 @@ class Automaton(object):
         if self.checked:
             return
         self._generate_tables()
+        self.stats.start("check")
 
         conflicts = Conflicts()
         shortcuts = None
@@ -288,8 +660,6 @@ class Automaton(object):
             state = todo.pop()
 
             for X,actions in self._get_all_actions(state).iteritems():
-                word = path[state] + (X,)
-
                 # try conflict overrides
                 if len(actions) > 1:
                     repl = [ a for a in actions
@@ -301,7 +671,7 @@ class Automaton(object):
                     if action[0] == 'S':
                         next_state = action[1]
                         if next_state not in path:
-                            path[next_state] = word
+                            path[next_state] = path[state] + (X,)
                             todo.add(next_state)
 
                 if len(actions) > 1:
@@ -309,7 +679,7 @@ class Automaton(object):
                     res = set()
                     for action in actions:
                         if action[0] == 'S':
-                            for k,l,n in self.closure_tab[state]:
+                            for k,l,n in self._state_closure(state):
                                 if n<l and self.g.rules[k][n] == X:
                                     res.add(('S',k,n))
                         else:
@@ -318,7 +688,7 @@ class Automaton(object):
                     if shortcuts is None:
                         shortcuts = self.g.shortcuts()
                     text = tuple(" ".join(repr(Y) for Y in shortcuts[Z])
-                                 for Z in word)
+                                 for Z in path[state] + (X,))
                     conflicts.add(res, text)
                     continue
 
@@ -335,6 +705,7 @@ class Automaton(object):
                         X = nt_tab[X]
                     rtab[(int(state),X)] = (nt_tab[rule[0]],len(rule)-1)
 
+        self.stats.stop("check")
         if conflicts:
             raise conflicts
 
@@ -344,6 +715,238 @@ class Automaton(object):
 
         self.checked = True
 
+    def cache_key(self):
+        """Return a string which identifies the parser tables.
+
+        The key is a hash of the production rules of the grammar,
+        together with all parameters which affect the parser tables.
+        Two automatons with the same key generate the same tables, so
+        that `cache_data` for one of them can be passed to
+        `load_cache_data` for the other.
+        """
+        def norm(X):
+            if isinstance(X, Unique):
+                return (1, X.label)
+            return (0, X)
+        rules = sorted((k,tuple(norm(X) for X in r))
+                       for k,r in self.g.rules.iteritems())
+        overrides = sorted((k,tuple(sorted(v)))
+                           for k,v in self.overrides.iteritems() if v)
+        data = (CACHE_FORMAT, VERSION, self.method,
+                self.replace_nonterminals, rules, overrides)
+        return sha1(repr(data)).hexdigest()
+
+    def cache_data(self):
+        """Return the parser tables in a form suitable for pickling.
+
+        The automaton must have been checked before.  The result can
+        be stored and later passed to `load_cache_data`.
+        """
+        assert self.checked
+        # the end-of-input marker is replaced by None, since it cannot
+        # be compared with the marker of a different grammar instance
+        EOF = self.g.EOF
+        def norm(tab, conv):
+            return dict(((s,X if X != EOF else None),conv(v))
+                        for (s,X),v in tab.iteritems())
+        return { "rtab": norm(self.rtab, tuple),
+                 "gtab": norm(self.gtab, int),
+                 "stab": norm(self.stab, int),
+                 "states": len(self.states),
+                 "halting_state": int(self.halting_state) }
+
+    def load_cache_data(self, data):
+        """Use parser tables previously returned by `cache_data`.
+
+        After this method is called, the automaton is considered to be
+        checked and the time-consuming generation of the parser tables
+        is skipped.  Only the information needed by `write_parser` and
+        `write_tables` is restored.
+        """
+        EOF = self.g.EOF
+        def denorm(tab):
+            return dict(((s,X if X is not None else EOF),v)
+                        for (s,X),v in tab.iteritems())
+        self.rtab = denorm(data["rtab"])
+        self.gtab = denorm(data["gtab"])
+        self.stab = denorm(data["stab"])
+        self.states = range(0, data["states"])
+        self.initial_state = 0
+        self.halting_state = data["halting_state"]
+        self.checked = True
+
+    def _integer_tables(self):
+        """Convert the parser tables into integer-indexed form.
+
+        Terminal symbols are numbered in the order given by
+        `Parser.terminals`, followed by EOF and a final column which
+        is used for unknown symbols.  Nonterminal symbols are numbered
+        in sorted order.
+
+        The return value is a 5-tuple `(tokens, action, rules, goto,
+        ntcols)`.  `tokens` is the list of terminal symbols, in column
+        order.  `action[state][column]` is 0 for errors, a positive
+        state number for shift actions, or `-k-1` for a reduction
+        using `rules[k]`.  Each entry of `rules` is a tuple `(X,n,j)`
+        where `X` is the nonterminal (as given by `nt_tab`), `n` is
+        the length of the right-hand side, and `j` is the column of
+        `X` in the goto table.  `goto[state][j]` gives the new state
+        after a reduction to the nonterminal in column `j`.  `ntcols`
+        is the number of goto columns.
+        """
+        self.check()
+
+        tokens = sorted(self.g.terminals-set([self.g.EOF]))
+        tokens.append(self.g.EOF)
+        t_col = dict((X,k) for k,X in enumerate(tokens))
+        nts = sorted(set(X for s,X in self.gtab) |
+                     set(X for X,n in self.rtab.itervalues()))
+        nt_col = dict((X,j) for j,X in enumerate(nts))
+
+        rules = sorted(set(self.rtab.itervalues()))
+        rule_idx = dict((r,k) for k,r in enumerate(rules))
+        rules = [ (X,n,nt_col[X]) for X,n in rules ]
+
+        nstates = len(self.states)
+        action = [ [0]*(len(tokens)+1) for k in range(0, nstates) ]
+        for (state,X),next_state in self.stab.iteritems():
+            assert int(next_state) > 0
+            action[state][t_col[X]] = int(next_state)
+        for (state,X),r in self.rtab.iteritems():
+            action[state][t_col[X]] = -rule_idx[r]-1
+
+        goto = [ [0]*len(nts) for k in range(0, nstates) ]
+        for (state,X),next_state in self.gtab.iteritems():
+            goto[state][nt_col[X]] = int(next_state)
+
+        return tokens, action, rules, goto, len(nts)
+
+    @staticmethod
+    def _pack_rows(rows, width):
+        """Compress a sparse table using row displacement.
+
+        `rows` is a list of dictionaries, mapping column numbers in
+        the range `0, ..., width-1` to non-zero table entries.  The
+        rows are overlaid in one vector such that no two entries
+        occupy the same position.
+
+        The return value is a tuple `(base, check, next)` where entry
+        `(r,c)` of the table can be found at position `i = base[r]+c`
+        if `check[i] == r`.  The vectors are padded so that all such
+        positions are valid indices; one additional sentinel entry at
+        the end makes position -1 safe, too.
+        """
+        base = [ 0 ] * len(rows)
+        check = []
+        next = []
+        order = sorted(range(0, len(rows)), key=lambda r: -len(rows[r]))
+        for r in order:
+            cols = sorted(rows[r])
+            if not cols:
+                continue
+            b = 0
+            while True:
+                for c in cols:
+                    if b+c < len(check) and check[b+c] != -1:
+                        break
+                else:
+                    break
+                b += 1
+            base[r] = b
+            if b+cols[-1] >= len(check):
+                pad = b+cols[-1]+1-len(check)
+                check.extend([-1]*pad)
+                next.extend([0]*pad)
+            for c in cols:
+                check[b+c] = r
+                next[b+c] = rows[r][c]
+        pad = max(base)+width+1-len(check)
+        check.extend([-1]*pad)
+        next.extend([0]*pad)
+        return base, check, next
+
+    def _packed_tables(self):
+        """Convert the parser tables into row-displacement form.
+
+        This starts from the tables returned by `_integer_tables`.
+        States where only one reduction is possible use this
+        reduction as a default action; all other states default to an
+        error.  For the goto table, which is compressed column by
+        column, the most frequent target state of each nonterminal is
+        used as the default.
+
+        The return value is a 4-tuple `(tokens, rules, action,
+        goto)`, where `action` is the tuple `(base, check, next,
+        default)` for the action table and `goto` is the
+        corresponding tuple for the goto table.
+        """
+        tokens, action, rules, goto, ntcols = self._integer_tables()
+
+        default = []
+        rows = []
+        for row in action:
+            reductions = set(a for a in row if a < 0)
+            if len(reductions) == 1:
+                d = reductions.pop()
+            else:
+                d = 0
+            default.append(d)
+            rows.append(dict((c,a) for c,a in enumerate(row)
+                             if a != 0 and a != d))
+        base, check, next = self._pack_rows(rows, len(tokens)+1)
+        action = (base, check, next, default)
+
+        default = []
+        rows = []
+        for j in range(0, ntcols):
+            count = {}
+            for row in goto:
+                if row[j]:
+                    count[row[j]] = count.get(row[j], 0) + 1
+            d = max(sorted(count), key=lambda x: count[x])
+            default.append(d)
+            rows.append(dict((state,row[j]) for state,row in enumerate(goto)
+                             if row[j] and row[j] != d))
+        base, check, next = self._pack_rows(rows, len(goto))
+        goto = (base, check, next, default)
+
+        return tokens, rules, action, goto
+
+    def _table_data(self):
+        """Encode the packed parser tables for a binary tables file.
+
+        The file starts with a header consisting of the magic string
+        "WISENT\\0\\0", the format version, a signature and the
+        number of vectors, followed by the lengths of all vectors and
+        finally the vectors themselves.  All numbers are stored as
+        little-endian 4-byte integers, so that the file can be
+        memory-mapped and the vectors can be read directly into
+        arrays.
+
+        The return value is a tuple `(signature, data)`, where
+        `signature` is a checksum which allows the generated parser
+        to verify that it uses the correct tables file.
+        """
+        tokens, rules, action, goto = self._packed_tables()
+        vectors = action + goto
+        lengths = pack("<%di"%len(vectors), *map(len, vectors))
+        body = "".join(pack("<%di"%len(v), *v) for v in vectors)
+        signature = crc32(lengths+body) & 0xffffffff
+        header = pack("<8siIi", "WISENT\0\0", 1, signature, len(vectors))
+        return signature, header+lengths+body
+
+    def write_tables(self, fd):
+        """Emit the parser tables into a binary file.
+
+        The tables are written to the file-like object `fd`, which
+        should be opened in binary mode.  The resulting file is used
+        by parsers generated with the `tables_file` option of
+        `write_parser`.
+        """
+        self.check()
+        signature, data = self._table_data()
+        fd.write(data)
+
     def write_transition_table(self, fd, prefix="# "):
         """Emit a textual description of the automaton's transition table.
 
@@ -416,7 +1019,7 @@ class Automaton(object):
             fd.write((prefix+str).rstrip()+'\n')
         write("parser states:")
         for state in self.states:
-            U = self.closure_tab[state]
+            U = self._state_closure(state)
             write("")
             msg = ""
             if state == self.initial_state:
@@ -449,6 +1052,12 @@ class Automaton(object):
         from time import strftime
         params.setdefault('date', strftime("%Y-%m-%d %H:%M:%S"))
         params['version'] = VERSION
+        if 'tables_file' in params:
+            params['tables'] = "packed"
+        params['integer_tables'] = params.get("tables", "dict") != "dict"
+        params['packed_tables'] = params.get("tables", "dict") == "packed"
+        params['reduce_function'] = (params.get("parser_actions", False)
+                                     or params.get("parser_arena", False))
 
         write_block(fd, 0, """# LR(1) parser, autogenerated on %(date)s
 # generator: wisent %(version)s, http://seehuhn.de/pages/wisent
@@ -467,6 +1076,16 @@ class Automaton(object):
 
         write_block(fd, 0, getsource(Unique))
         fd.write('\n')
+        if params.get("parser_arena", False):
+            write_block(fd, 0, getsource(template.Arena))
+            fd.write('\n')
+            write_block(fd, 0, getsource(template.Cursor))
+            fd.write('\n')
+        if params.get("parser_many", False):
+            write_block(fd, 0, getsource(template._parse_many_init))
+            fd.write('\n')
+            write_block(fd, 0, getsource(template._parse_many_worker))
+            fd.write('\n')
 
         fd.write('class Parser(object):\n\n')
 
@@ -504,6 +1123,7 @@ class Automaton(object):
         for l in split_it(tt, padding="    ", start1="terminals = [ ",
                           end2=" ]"):
             fd.write(l+'\n')
+        fd.write("    _terminal_set = frozenset(terminals)\n")
         nt_tab = self.nt_tab
         transparent = params.get("transparent_tokens", set())
         transparent &= self.g.nonterminals
@@ -517,7 +1137,8 @@ class Automaton(object):
         if transparent:
             tt = [ repr(nt_tab[X]) for X in sorted(transparent) ]
             for l in split_it(tt, padding="    ",
-                              start1="_transparent = [ ", end2=" ]"):
+                              start1="_transparent = frozenset([ ",
+                              end2=" ])"):
                 fd.write(l+'\n')
 
         fd.write("    EOF = Unique('EOF')\n")
@@ -527,6 +1148,98 @@ class Automaton(object):
         fd.write('\n')
         fd.write("    _halting_state = %s\n"%self.halting_state)
 
+        stats = self.stats
+        stats.set("states", len(self.states))
+        stats.set("shift_entries", len(self.stab))
+        stats.set("goto_entries", len(self.gtab))
+        stats.set("reduce_entries", len(self.rtab))
+
+        tables = params.get("tables", "dict")
+        if tables == "dense":
+            self._write_dense_tables(fd)
+        elif tables == "packed":
+            self._write_packed_tables(fd, params.get("tables_file"))
+        else:
+            self._write_dict_tables(fd)
+        self._write_expected(fd)
+        scanner = params.get("scanner")
+        if scanner is not None:
+            fd.write('\n')
+            scanner.write_tables(fd)
+
+        if params['reduce_function']:
+            write_block(fd, 4, getsource(template.Parser._Children))
+        write_block(fd, 4, getsource(template.Parser.__init__), params)
+        if 'tables_file' in params:
+            write_block(fd, 4, getsource(template.Parser.load_tables))
+        write_block(fd, 4, getsource(template.Parser.expected), params)
+        write_block(fd, 4, getsource(template.Parser.leaves), params)
+        write_block(fd, 4, getsource(template.Parser.preorder), params)
+        write_block(fd, 4, getsource(template.Parser.postorder), params)
+        if scanner is not None:
+            write_block(fd, 4, getsource(template.Parser.scan), params)
+        write_block(fd, 4, getsource(template.Parser._parse), params)
+        if params.get("parser_stats", False):
+            write_block(fd, 4, getsource(template.Parser.reset_stats))
+            write_block(fd, 4, getsource(template.Parser._record_stats))
+        if params.get("parser_actions", False):
+            write_block(fd, 4, getsource(template.Parser._apply_action),
+                        params)
+        if params.get("parser_arena", False):
+            write_block(fd, 4, getsource(template.Parser._arena_reduce),
+                        params)
+        write_block(fd, 4, getsource(template.Parser._finish_tree), params)
+        write_block(fd, 4, getsource(template.Parser._try_parse), params)
+        write_block(fd, 4, getsource(template.Parser._add_error), params)
+        write_block(fd, 4, getsource(template.Parser._recover), params)
+        write_block(fd, 4, getsource(template.Parser.parse), params)
+        if params.get("parser_many", False):
+            write_block(fd, 4, getsource(template.Parser.parse_many), params)
+        write_block(fd, 4, getsource(template.Parser.feed), params)
+        write_block(fd, 4, getsource(template.Parser.finish), params)
+        write_block(fd, 4, getsource(template.Parser._push_parse), params)
+
+    def _write_expected(self, fd):
+        """Emit the table of valid terminal symbols for every state.
+
+        Since many states share the same set of symbols, every
+        distinct set is only stored once in `_expected_sets`, and
+        `_expected` gives the index into this table for every state.
+        """
+        valid = [ set() for state in self.states ]
+        for state,X in self.rtab:
+            valid[state].add(X)
+        for state,X in self.stab:
+            valid[state].add(X)
+
+        EOF = self.g.EOF
+        sets = []
+        set_idx = {}
+        index = []
+        for tt in valid:
+            has_eof = EOF in tt
+            tt = sorted(tt-set([EOF]))
+            if has_eof:
+                tt.append(EOF)
+            tt = tuple(tt)
+            if tt not in set_idx:
+                set_idx[tt] = len(sets)
+                sets.append(tt)
+            index.append(set_idx[tt])
+
+        fd.write("    _expected_sets = (\n")
+        for tt in sets:
+            end = ",)," if len(tt) == 1 else "),"
+            for l in split_it(map(repr, tt), padding="        ",
+                              start1="(", end2=end):
+                fd.write(l+'\n')
+        fd.write("    )\n")
+        for l in split_it(map(str, index), padding="    ",
+                          start1="_expected = ( ", end2=" )"):
+            fd.write(l+'\n')
+
+    def _write_dict_tables(self, fd):
+        """Emit the parser tables as dictionaries keyed by (state, symbol)."""
         # reduce actions
         rtab = self.rtab
         r_items = [ "%s: %s"%(repr(key),repr(rtab[key]))
@@ -554,8 +1267,67 @@ class Automaton(object):
             fd.write(l+'\n')
         fd.write("    }\n")
 
-        write_block(fd, 4, getsource(template.Parser.__init__), params)
-        write_block(fd, 4, getsource(template.Parser.leaves), params)
-        write_block(fd, 4, getsource(template.Parser._parse), params)
-        write_block(fd, 4, getsource(template.Parser._try_parse), params)
-        write_block(fd, 4, getsource(template.Parser.parse), params)
+    @staticmethod
+    def _write_token_ids(fd, tokens, rules):
+        """Emit the symbol-to-column map and the list of reductions."""
+        # map terminal symbols to table columns
+        tt = [ "%s: %d"%(repr(X),k) for k,X in enumerate(tokens) ]
+        for l in split_it(tt, padding="    ", start1="_token_id = { ",
+                          end2=" }"):
+            fd.write(l+'\n')
+
+        # production rules used in reductions
+        fd.write("    _rules = (\n")
+        for l in split_it(map(repr, rules), padding="        ", end2=","):
+            fd.write(l+'\n')
+        fd.write("    )\n")
+
+    def _write_dense_tables(self, fd):
+        """Emit the parser tables as tuples indexed by integers."""
+        tokens, action, rules, goto, ntcols = self._integer_tables()
+        self._write_token_ids(fd, tokens, rules)
+        self.stats.set("table_cells",
+                       sum(map(len, action)) + sum(map(len, goto)))
+
+        # combined shift/reduce table
+        fd.write("    _action = (\n")
+        for row in action:
+            for l in split_it(map(str, row), padding="        ",
+                              start1="(", end2="),"):
+                fd.write(l+'\n')
+        fd.write("    )\n")
+
+        # goto table
+        fd.write("    _goto = (\n")
+        for row in goto:
+            end = ",)," if len(row) == 1 else "),"
+            for l in split_it(map(str, row), padding="        ",
+                              start1="(", end2=end):
+                fd.write(l+'\n')
+        fd.write("    )\n")
+
+    def _write_packed_tables(self, fd, tables_file=None):
+        """Emit the parser tables in compressed, row-displacement form.
+
+        If `tables_file` is given, only a reference to this file is
+        emitted instead of the vectors; the file itself must be
+        written using `write_tables`.
+        """
+        tokens, rules, action, goto = self._packed_tables()
+        self._write_token_ids(fd, tokens, rules)
+        self.stats.set("table_cells", sum(map(len, action+goto)))
+
+        names = [ "_base", "_check", "_next", "_default",
+                  "_gbase", "_gcheck", "_gnext", "_gdefault" ]
+        if tables_file is not None:
+            signature, data = self._table_data()
+            fd.write("    _tables_file = %s\n"%repr(tables_file))
+            fd.write("    _tables_signature = 0x%08x\n"%signature)
+            for name in names:
+                fd.write("    %s = None\n"%name)
+            return
+        for name,vec in zip(names, action+goto):
+            end = ", )" if len(vec) == 1 else " )"
+            for l in split_it(map(str, vec), padding="    ",
+                              start1=name+" = ( ", end2=end):
+                fd.write(l+'\n')
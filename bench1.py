@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+# bench1.py - measure the time needed for the grammar analysis in Wisent
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Time the construction of `Grammar` objects for synthetic grammars.
+
+The nullable symbols, first sets and follow sets are computed every
+time a `Grammar` is constructed.  This script builds grammars with
+thousands of nonterminals, so that the scaling of these computations
+with the grammar size can be observed.
+"""
+
+import sys
+from time import time
+
+from grammar import Grammar
+
+
+def chain(n):
+    """A chain of nullable nonterminals, listed from the bottom up.
+
+    Every symbol can start with every terminal further down the
+    chain, and the follow sets propagate through the whole chain.
+    """
+    rules = [ ('S', 'N%d'%(n-1)) ]
+    for i in range(n-1, 0, -1):
+        rules.append(('N%d'%i, 'N%d'%(i-1), 't%d'%(i%50), 'N%d'%(i-1)))
+        rules.append(('N%d'%i, ))
+    rules.append(('N0', 'x'))
+    return rules
+
+def cycle(n):
+    """Nonterminals which form one big strongly connected component."""
+    rules = [ ('S', 'N0') ]
+    for i in range(0, n):
+        rules.append(('N%d'%i, 'N%d'%((i+1)%n), 't%d'%(i%50)))
+        rules.append(('N%d'%i, ))
+    return rules
+
+def layers(n):
+    """Expression-like grammar with `n` precedence levels."""
+    rules = [ ('S', 'E0') ]
+    for i in range(0, n):
+        rules.append(('E%d'%i, 'E%d'%i, 'op%d'%(i%50), 'E%d'%(i+1)))
+        rules.append(('E%d'%i, 'E%d'%(i+1)))
+    rules.append(('E%d'%n, '(', 'E0', ')'))
+    rules.append(('E%d'%n, 'id'))
+    return rules
+
+def run(name, make, sizes):
+    for n in sizes:
+        rules = make(n)
+        t0 = time()
+        Grammar(rules)
+        t = time() - t0
+        print "%-8s %6d nonterminals  %8.3fs"%(name, n, t)
+        sys.stdout.flush()
+
+sizes = [ 1000, 2000, 4000, 8000 ]
+if len(sys.argv) > 1:
+    sizes = [ int(arg) for arg in sys.argv[1:] ]
+run("chain", chain, sizes)
+run("cycle", cycle, sizes)
+run("layers", layers, sizes)
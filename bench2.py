@@ -0,0 +1,105 @@
+#! /usr/bin/env python
+# bench2.py - measure the speed of the parse tree walkers
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Time the tree walkers of a generated parser on large parse trees.
+
+Two trees with about 10^5 nodes each are used: a deep tree, as
+produced by a left-recursive list production, and a shallow tree
+where every list element is a small expression.  For comparison, the
+recursive generator which was used for `Parser.leaves` in earlier
+versions of Wisent is timed, too.
+"""
+
+import sys
+from os import remove, rmdir
+from os.path import join
+from tempfile import mkdtemp
+from time import time
+
+from grammar import Grammar
+from automaton import Automaton
+
+
+def recursive_leaves(tree, terminals):
+    """The recursive implementation of `leaves` from Wisent 0.6.2."""
+    if tree[0] in terminals:
+        yield tree
+    else:
+        for x in tree[1:]:
+            for t in recursive_leaves(x, terminals):
+                yield t
+
+def make_parser(rules):
+    testdir = mkdtemp()
+    fd = open(join(testdir, "benchparser.py"), "w")
+    Automaton(Grammar(rules)).write_parser(fd)
+    fd.close()
+    sys.path.insert(0, testdir)
+    import benchparser
+    del sys.path[0]
+    for fname in [ "benchparser.py", "benchparser.pyc" ]:
+        try:
+            remove(join(testdir, fname))
+        except OSError:
+            pass
+    rmdir(testdir)
+    return benchparser.Parser
+
+def timeit(fn, repeat=3):
+    best = None
+    for k in range(0, repeat):
+        t0 = time()
+        fn()
+        t = time() - t0
+        if best is None or t < best:
+            best = t
+    return best
+
+rules = [
+    ('list', 'list', 'item'),
+    ('list', 'item'),
+    ('item', 'expr', ';'),
+    ('expr', 'expr', '+', 'NUM'),
+    ('expr', 'NUM'),
+    ]
+Parser = make_parser(rules)
+p = Parser()
+
+deep = p.parse([('NUM',), (';',)]*20000)
+item = p.parse([('NUM',), ('+',), ('NUM',), (';',)])[1]
+shallow = ('list',) + (item,)*14286
+terminals = Parser.terminals
+
+for name, tree in [ ("deep", deep), ("shallow", shallow) ]:
+    n = sum(1 for x in Parser.preorder(tree))
+    print "%s tree, %d nodes:"%(name, n)
+    tests = [
+        ("leaves", lambda: sum(1 for x in Parser.leaves(tree))),
+        ("preorder", lambda: sum(1 for x in Parser.preorder(tree))),
+        ("postorder", lambda: sum(1 for x in Parser.postorder(tree))),
+        ("recursive leaves",
+         lambda: sum(1 for x in recursive_leaves(tree, terminals))),
+        ]
+    for label, fn in tests:
+        try:
+            t = timeit(fn)
+        except RuntimeError:
+            print "  %-18s recursion limit exceeded"%label
+            continue
+        print "  %-18s %8.3fs"%(label, t)
@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+# bench3.py - compare generated scanners to a list of regular expressions
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Time the scanner generated from a `%tokens` section.
+
+The token definitions of the CSS example (examples/css/scanner.py)
+are translated into a `%tokens` section for "css.wi".  Both the
+hand-written scanner, which tries all regular expressions at every
+position of the input, and the `scan` method of the generated parser
+are then used to split a large style sheet into tokens.  The results
+of both scanners are checked to be identical.
+
+The sample input avoids numbers like "1.2" without a unit: for these,
+the alternatives in `{num}` make the `re` module match "1" only,
+whereas the generated scanner finds the longest match.
+"""
+
+import sys
+from imp import load_source
+from os import remove, rmdir
+from os.path import dirname, join
+from tempfile import mkdtemp
+from time import time
+
+from grammar import read_grammar
+from automaton import Automaton
+
+cssdir = join(dirname(__file__) or ".", "examples", "css")
+# Wisent has a module "scanner" of its own
+tokens = load_source("css_scanner", join(cssdir, "scanner.py")).tokens
+
+css_tokens = r"""
+%tokens
+%ignorecase
+%define h [0-9a-f]
+%define nonascii [\x80-\xff]
+%define unicode \\{h}{1,6}(\r\n|[ \t\r\n\f])?
+%define escape {unicode}|\\[^\r\n\f0-9a-f]
+%define nmstart [_a-z]|{nonascii}|{escape}
+%define nmchar [_a-z0-9-]|{nonascii}|{escape}
+%define nl \n|\r\n|\r|\f
+%define string1 "([^\n\r\f\\"]|\\{nl}|{escape})*"
+%define string2 '([^\n\r\f\\']|\\{nl}|{escape})*'
+%define invalid1 "([^\n\r\f\\"]|\\{nl}|{escape})*
+%define invalid2 '([^\n\r\f\\']|\\{nl}|{escape})*
+%define comment /\*[^*]*\*+([^/*][^*]*\*+)*/
+%define ident -?{nmstart}{nmchar}*
+%define name {nmchar}+
+%define num [0-9]+|[0-9]*\.[0-9]+
+%define string {string1}|{string2}
+%define invalid {invalid1}|{invalid2}
+%define url ([!#$%&*-~]|{nonascii}|{escape})*
+%define s [ \t\r\n\f]+
+%define w {s}?
+"""
+
+# the case-insensitive letters, as in examples/css/scanner.py
+for c, code in [ ("A", "41"), ("C", "43"), ("D", "44"), ("E", "45") ]:
+    css_tokens += r"%%define %s %s|\\0{0,4}(%s|%x)(\r\n|[ \t\r\n\f])?"%(
+        c, c.lower(), code, int(code, 16)+32) + "\n"
+for c in "GHIKLMNOPRSTUXZ":
+    code = "%x"%ord(c)
+    css_tokens += r"%%define %s %s|\\0{0,4}(%s|%x)(\r\n|[ \t\r\n\f])?|\\%s"%(
+        c, c.lower(), code, int(code, 16)+32, c.lower()) + "\n"
+
+css_tokens += r"""
+S {s}
+%ignore /\*[^*]*\*+([^/*][^*]*\*+)*/
+CDO <!--
+CDC -->
+INCLUDES ~=
+DASHMATCH \|=
+LBRACE {w}\{
+PLUS {w}\+
+GREATER {w}>
+COMMA {w},
+STRING {string}
+INVALID {invalid}
+IDENT {ident}
+HASH #{name}
+IMPORT_SYM @{I}{M}{P}{O}{R}{T}
+PAGE_SYM @{P}{A}{G}{E}
+MEDIA_SYM @{M}{E}{D}{I}{A}
+CHARSET_SYM @charset\x20
+IMPORTANT_SYM !({w}|{comment})*{I}{M}{P}{O}{R}{T}{A}{N}{T}
+EMS {num}{E}{M}
+EXS {num}{E}{X}
+LENGTH {num}({P}{X}|{C}{M}|{M}{M}|{I}{N}|{P}{T}|{P}{C})
+ANGLE {num}({D}{E}{G}|{R}{A}{D}|{G}{R}{A}{D})
+TIME {num}({M}{S}|{S})
+FREQ {num}({H}{Z}|{K}{H}{Z})
+DIMENSION {num}{ident}
+PERCENTAGE {num}%
+NUMBER {num}
+URI {U}{R}{L}\({w}{string}{w}\)|{U}{R}{L}\({w}{url}{w}\)
+FUNCTION {ident}\(
+"""
+
+def make_parser():
+    text = open(join(cssdir, "css.wi")).read()
+    lines = unicode(text+css_tokens, "utf-8").splitlines()
+    params = { "fname": "css.wi" }
+    t0 = time()
+    g = read_grammar(lines, params)
+    scanner = params["scanner"]
+    t = time() - t0
+    print "scanner: %d states, %d character classes (%.2fs)"%(
+        len(scanner.rows), scanner.nclasses, t)
+
+    testdir = mkdtemp()
+    fd = open(join(testdir, "benchcss.py"), "w")
+    Automaton(g).write_parser(fd, params)
+    fd.close()
+    sys.path.insert(0, testdir)
+    import benchcss
+    del sys.path[0]
+    for fname in [ "benchcss.py", "benchcss.pyc" ]:
+        try:
+            remove(join(testdir, fname))
+        except OSError:
+            pass
+    rmdir(testdir)
+    return benchcss.Parser
+
+def timeit(fn, repeat=3):
+    best = None
+    for k in range(0, repeat):
+        t0 = time()
+        res = fn()
+        t = time() - t0
+        if best is None or t < best:
+            best = t
+    return best, res
+
+sample = r"""@import url("style.css") screen;
+/* a comment */
+h1, h2 > p.intro + em { color: #ff0000 !important; margin: 0 1.5em -2px }
+a:hover { background: url(img/bg.png) no-repeat; width: 50% }
+div#main { font: 12pt/normal "Helvetica", sans-serif;
+           transform: rotate(45deg) }
+"""
+
+p = make_parser()()
+for n in [ 10, 100, 1000 ]:
+    text = sample*n
+    print "%d bytes of input:"%len(text)
+    t1, res1 = timeit(lambda: list(tokens(text)))
+    print "  %-18s %8.3fs"%("regular expressions", t1)
+    t2, res2 = timeit(lambda: list(p.scan(text)))
+    print "  %-18s %8.3fs"%("generated scanner", t2)
+    if res1 != res2:
+        print "  results differ!"
+        raise SystemExit(1)
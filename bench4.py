@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+# bench4.py - measure the speed of the grammar file scanner
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Time the scanner for grammar files on a large synthetic grammar.
+
+The grammar has one rule per line, using all kinds of tokens (names,
+strings with escape sequences, comments and punctuation).  For
+comparison, the character-by-character scanner which was used in
+earlier versions of Wisent is timed, too, and both scanners are checked
+to give the same result.
+"""
+
+from time import time
+
+from scanner import tokens, conv
+
+
+def char_tokens(source):
+    """The implementation of `scanner.tokens` from Wisent 0.6.2."""
+    s = None
+    state = None
+    line = 1
+    for l in source:
+        l = l.expandtabs()
+        if not l.endswith("\n"):
+            l = l + '\n'
+        for col, c in enumerate(l):
+            if state == "skip":
+                state = None
+            elif state == "word":
+                if c.isalnum() or c in "-_":
+                    s += c
+                else:
+                    yield ("token", conv(s), line0, col0)
+                    state = None
+            elif state == "string":
+                if c == '\\':
+                    state = "quote"
+                elif c == sep:
+                    yield ("string", conv(s), line0, col0)
+                    state = "skip"
+                else:
+                    s += c
+            elif state == "quote":
+                s += c
+                state = "string"
+            elif state == "comment" and c == '\n':
+                state = "skip"
+
+            if state is None:
+                line0 = line
+                col0 = col+1
+                if c == "'":
+                    state = "string"
+                    sep = "'"
+                    s = ""
+                elif c == '"':
+                    state = "string"
+                    sep = '"'
+                    s = ""
+                elif c.isalnum() or c == "_":
+                    state = "word"
+                    s = c
+                elif c == "#":
+                    state = "comment"
+                elif c.isspace():
+                    state = "skip"
+                else:
+                    yield (conv(c), conv(c), line0, col0)
+                    state = "skip"
+        line += 1
+
+    if state == "word":
+        yield ("token", conv(s), line0, col0)
+    elif state not in [ None, "skip", "comment" ]:
+        if l[-1] == '\n':
+            l = l[:-1]
+        msg = "unterminated string"
+        raise SyntaxError(msg, (source.name, line0, col0, l[-20:]))
+
+def make_grammar(n):
+    lines = [ u"# a synthetic grammar with %d rules"%n ]
+    for k in range(0, n):
+        lines.append(u"rule-%d: _item%d ( 'x%d' | \"q\\\"%d\" )* ;  # %d"%(
+            k, k, k, k, k))
+        lines.append(u"\t_item%d: NAME_%d '+' rule-%d | '\\'';"%(k, k, k+1))
+    return lines
+
+def timeit(fn, repeat=3):
+    best = None
+    for k in range(0, repeat):
+        t0 = time()
+        res = fn()
+        t = time() - t0
+        if best is None or t < best:
+            best = t
+    return best, res
+
+for n in [ 1000, 10000, 50000 ]:
+    lines = make_grammar(n)
+    print "%d lines of input:"%len(lines)
+    t1, res1 = timeit(lambda: list(char_tokens(lines)))
+    print "  %-18s %8.3fs"%("character loop", t1)
+    t2, res2 = timeit(lambda: list(tokens(lines)))
+    print "  %-18s %8.3fs"%("regular expression", t2)
+    if res1 != res2:
+        print "  results differ!"
+        raise SystemExit(1)
@@ -0,0 +1,112 @@
+#! /usr/bin/env python
+# bench5.py - measure the scaling of Parser.parse_many
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Time `Parser.parse_many` for different numbers of worker processes.
+
+Many small inputs are parsed with parsers generated from the
+calculator and the CSS examples.  The speedup is given relative to
+parsing in the current process (`workers=1`); it can only grow with
+the number of workers up to the number of CPUs of the machine.
+"""
+
+import sys
+from imp import load_source
+from multiprocessing import cpu_count
+from os import remove, rmdir
+from os.path import dirname, join
+from random import choice, randint, seed
+from tempfile import mkdtemp
+from time import time
+
+from grammar import read_grammar
+from automaton import Automaton
+
+exdir = join(dirname(__file__) or ".", "examples")
+
+def make_parser(fname, modname):
+    text = open(fname).read()
+    params = { "fname": fname, "parser_many": True }
+    g = read_grammar(unicode(text, "utf-8").splitlines(), params)
+    testdir = mkdtemp()
+    fd = open(join(testdir, modname+".py"), "w")
+    Automaton(g).write_parser(fd, params)
+    fd.close()
+    sys.path.insert(0, testdir)
+    module = __import__(modname)
+    del sys.path[0]
+    for name in [ modname+".py", modname+".pyc" ]:
+        try:
+            remove(join(testdir, name))
+        except OSError:
+            pass
+    rmdir(testdir)
+    return module.Parser
+
+def calc_input():
+    tokens = []
+    for k in range(0, randint(20, 60)):
+        if k > 0:
+            tokens.append((choice("+-*/"),))
+        if randint(0, 3) == 0:
+            tokens.extend([ ('SYMBOL', 'sin'), ('(',), ('NUMBER', 1.0),
+                            ('+',), ('NUMBER', 2.0), (')',) ])
+        else:
+            tokens.append(('NUMBER', float(k)))
+    return tokens
+
+css_sample = [
+    "h1, h2 > p.intro + em { color: #ff0000 !important; margin: 0 }\n",
+    "a:hover { background: url(img/bg.png) no-repeat; width: 50% }\n",
+    "div#main { font: 12pt \"Helvetica\", sans-serif }\n",
+    "@media print { body { font-size: 10pt } }\n",
+    ]
+css_tokens = load_source("css_scanner",
+                         join(exdir, "css", "scanner.py")).tokens
+
+def css_input():
+    text = "".join(choice(css_sample) for k in range(0, randint(5, 15)))
+    return list(css_tokens(text))
+
+def bench(Parser, inputs, worker_counts):
+    p = Parser()
+    base = None
+    for workers in worker_counts:
+        t0 = time()
+        n = sum(1 for res in p.parse_many(inputs, workers=workers)
+                if isinstance(res, p.ParseErrors))
+        t = time() - t0
+        if base is None:
+            base = t
+        print "  %2d workers %8.3fs  speedup %.2f"%(workers, t, base/t)
+        if n:
+            print "  %d inputs had parse errors"%n
+
+seed(1)
+worker_counts = sorted(set([ 1, 2, 4, cpu_count() ]))
+print "%d CPUs"%cpu_count()
+
+Parser = make_parser(join(exdir, "calculator", "calculator.wi"), "benchcalc")
+inputs = [ calc_input() for k in range(0, 5000) ]
+print "calculator, %d inputs:"%len(inputs)
+bench(Parser, inputs, worker_counts)
+
+Parser = make_parser(join(exdir, "css", "css.wi"), "benchcss")
+inputs = [ css_input() for k in range(0, 1000) ]
+print "CSS, %d inputs:"%len(inputs)
+bench(Parser, inputs, worker_counts)
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# bench6.py - compare the memory use of tuple trees and arena trees
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Measure the size of parse trees in memory.
+
+A parser for a list of expressions is used to parse inputs with up to
+8*10^5 tokens, once building the usual nested tuples and once building
+an `Arena`.  The size of the trees is computed using `sys.getsizeof`,
+not counting the input tokens which are shared by both
+representations.  The time needed to parse the input is given, too.
+"""
+
+import sys
+from os import remove, rmdir
+from os.path import join
+from tempfile import mkdtemp
+from time import time
+
+from grammar import Grammar
+from automaton import Automaton
+
+
+def make_parser(rules):
+    testdir = mkdtemp()
+    fd = open(join(testdir, "benchparser.py"), "w")
+    Automaton(Grammar(rules)).write_parser(fd, { "parser_arena": True })
+    fd.close()
+    sys.path.insert(0, testdir)
+    import benchparser
+    del sys.path[0]
+    for fname in [ "benchparser.py", "benchparser.pyc" ]:
+        try:
+            remove(join(testdir, fname))
+        except OSError:
+            pass
+    rmdir(testdir)
+    return benchparser.Parser
+
+def tuple_size(tree, terminals):
+    size = 0
+    stack = [ tree ]
+    while stack:
+        tree = stack.pop()
+        if tree[0] not in terminals:
+            size += sys.getsizeof(tree)
+            stack.extend(tree[1:])
+    return size
+
+def arena_size(arena):
+    size = sys.getsizeof(arena.tokens) + sys.getsizeof(arena.symbols)
+    for column in [ arena.symbol, arena.first, arena.count,
+                    arena.children ]:
+        size += sys.getsizeof(column)
+    return size
+
+rules = [
+    ('list', 'list', 'item'),
+    ('list', 'item'),
+    ('item', 'expr', ';'),
+    ('expr', 'expr', '+', 'term'),
+    ('expr', 'term'),
+    ('term', 'NUM'),
+    ('term', '(', 'expr', ')'),
+    ]
+Parser = make_parser(rules)
+terminals = frozenset(Parser.terminals)
+item = [ ('NUM',), ('+',), ('(',), ('NUM',), ('+',), ('NUM',), (')',),
+         (';',) ]
+
+for n in [ 1000, 10000, 100000 ]:
+    tokens = item*n
+    print "%d tokens:"%len(tokens)
+    for label, p in [ ("tuples", Parser()), ("arena", Parser(arena=True)) ]:
+        t0 = time()
+        tree = p.parse(tokens)
+        t = time() - t0
+        if label == "tuples":
+            size = tuple_size(tree, terminals)
+        else:
+            size = arena_size(tree)
+        print "  %-8s %10d bytes %8.3fs"%(label, size, t)
+        del tree
@@ -0,0 +1,465 @@
+#! /usr/bin/env python
+# bench7.py - a benchmark suite for Wisent and the generated parsers
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Run a suite of benchmarks and compare the results of two runs.
+
+Parsers are generated for all grammars in the "examples" directory
+(grammars with conflicts are skipped) and for a few synthetic
+grammars which can be scaled: towers of binary operators with many
+precedence levels, long lists and deeply nested blocks.  For every
+parser, the following quantities are measured:
+
+  generate    time to construct and check the parser tables
+  write       time to emit the Python source of the parser
+  import      time to import the generated module
+  parse_rate  parse throughput, in tokens per second
+  recovery    average time to recover from one parse error
+
+Inputs for the example grammars are random sentences, generated with
+a fixed seed so that all runs use the same inputs.
+
+The results are printed and, with the option -o, stored as a JSON
+file.  Two such files can be compared using
+
+    ./bench7.py --compare old.json new.json
+
+which lists the relative changes and flags every quantity which got
+worse by more than the threshold given by --threshold (default 20%);
+in this case the exit status is 1.  Timings vary from run to run by
+several percent, even though garbage collection is disabled and the
+best of several measurements is used, so only runs on the same
+machine should be compared.
+"""
+
+import gc
+import json
+import sys
+from glob import glob
+from imp import load_source
+from optparse import OptionParser
+from os import remove, rmdir
+from os.path import dirname, join
+from random import Random
+from StringIO import StringIO
+from tempfile import mkdtemp
+from time import time
+
+from grammar import Grammar, read_grammar
+from automaton import Automaton
+from version import VERSION
+
+# increase this when the layout of the result files changes
+FORMAT = 1
+
+# quantities where smaller values are better; for all others, larger
+# values are better
+TIMES = [ "generate", "write", "import", "recovery" ]
+METRICS = TIMES[:3] + [ "parse_rate" ] + TIMES[3:]
+
+# differences between times below this value (in seconds) are ignored
+# by the comparison
+MIN_TIME = 0.001
+
+# all quantities are measured several times and the best result is used
+REPEAT = 5
+
+
+######################################################################
+# the benchmarks
+
+def sentence(g, size, seed):
+    """Construct a random sentence of about `size` tokens for `g`.
+
+    While the sentence is too short, rules which contain nonterminals
+    are preferred; the remaining nonterminals are finally replaced by
+    their shortest expansions.
+    """
+    rnd = Random(seed)
+    nt = g.nonterminals
+    rules = {}
+    growing = {}
+    for r in g.rules.itervalues():
+        rules.setdefault(r[0], []).append(r[1:])
+        if any(X in nt for X in r[1:]):
+            growing.setdefault(r[0], []).append(r[1:])
+    # rule -1 is the rule `S -> start EOF` added by `Grammar`
+    word = [ g.rules[-1][1] ]
+    for step in range(0, 10*size):
+        if len(word) >= size:
+            break
+        pos = [ i for i,X in enumerate(word) if X in nt ]
+        if not pos:
+            break
+        i = rnd.choice(pos)
+        word[i:i+1] = rnd.choice(growing.get(word[i]) or rules[word[i]])
+    short = g.shortcuts()
+    res = []
+    for X in word:
+        res.extend((Y,) for Y in short[X])
+    return res
+
+def example(fname):
+    """Benchmark for a grammar file from the "examples" directory."""
+    def read(checkfunc):
+        params = { "fname": fname }
+        lines = unicode(open(fname).read(), "utf-8").splitlines()
+        return read_grammar(lines, params, checkfunc), params
+    def make_input(a, size, seed=1):
+        return sentence(a.g, size, seed)
+    return read, make_input
+
+def synthetic(rules, make_input):
+    """Benchmark for a grammar given as a list of rules."""
+    def read(checkfunc):
+        params = {}
+        return checkfunc(Grammar(rules), params), params
+    return read, lambda a, size, seed=1: make_input(size)
+
+def expr_tower(levels):
+    """Binary operators with `levels` levels of precedence."""
+    rules = []
+    for k in range(0, levels):
+        X = "e%d"%k
+        Y = "e%d"%(k+1)
+        rules.append((X, X, "op%d"%k, Y))
+        rules.append((X, Y))
+    X = "e%d"%levels
+    rules.append((X, "NUM"))
+    rules.append((X, "(", "e0", ")"))
+    def make_input(size):
+        rnd = Random(1)
+        res = [ ("NUM",) ]
+        depth = 0
+        while len(res) < size:
+            res.append(("op%d"%rnd.randrange(levels),))
+            if rnd.random() < 0.1:
+                res.append(("(",))
+                depth += 1
+            res.append(("NUM",))
+            if depth and rnd.random() < 0.1:
+                res.append((")",))
+                depth -= 1
+        res.extend([ (")",) ]*depth)
+        return res
+    return synthetic(rules, make_input)
+
+def long_list():
+    """A left-recursive list of short statements."""
+    rules = [
+        ("list", "list", "item"),
+        ("list", "item"),
+        ("item", "NAME", "=", "NUM", ";"),
+        ("item", "NAME", ";"),
+        ]
+    def make_input(size):
+        item = [ ("NAME",), ("=",), ("NUM",), (";",), ("NAME",), (";",) ]
+        return item*(size//len(item))
+    return synthetic(rules, make_input)
+
+def nested_blocks():
+    """Blocks of statements, nested to a large depth."""
+    rules = [
+        ("block", "{", "stmts", "}"),
+        ("stmts", "stmts", "stmt"),
+        ("stmts", ),
+        ("stmt", "block"),
+        ("stmt", "NAME", ";"),
+        ("stmt", "if", "NAME", "block"),
+        ]
+    def make_input(size):
+        depth = size//6
+        head = [ ("{",), ("NAME",), (";",), ("if",), ("NAME",) ]*depth
+        return head + [ ("{",) ] + [ ("}",) ]*(depth+1)
+    return synthetic(rules, make_input)
+
+def all_benchmarks(quick):
+    res = []
+    base = dirname(__file__) or "."
+    fnames = glob(join(base, "examples", "*.wi"))
+    fnames += glob(join(base, "examples", "*", "*.wi"))
+    for fname in sorted(fnames):
+        name = fname[len(base)+1:]
+        res.append((name, example(fname)))
+    if quick:
+        levels = [ 5, 10 ]
+    else:
+        levels = [ 5, 10, 20, 40 ]
+    for n in levels:
+        res.append(("expr-tower-%d"%n, expr_tower(n)))
+    res.append(("long-list", long_list()))
+    res.append(("nested-blocks", nested_blocks()))
+    return res
+
+
+######################################################################
+# measurements
+
+def best_time(fn, repeat=REPEAT):
+    best = None
+    for k in range(0, repeat):
+        t0 = time()
+        fn()
+        t = time() - t0
+        if best is None or t < best:
+            best = t
+    return best
+
+def import_parser(testdir, name, a, params):
+    """Write the parser for `a` and import it.
+
+    Returns the module and the best times needed for writing and
+    importing.
+    """
+    fname = join(testdir, name+".py")
+    t_write = t_import = None
+    for k in range(0, REPEAT):
+        t0 = time()
+        fd = open(fname, "w")
+        a.write_parser(fd, params)
+        fd.close()
+        t1 = time()
+        module = load_source(name, fname)
+        t2 = time()
+        for f in [ fname, fname+"c" ]:
+            try:
+                remove(f)
+            except OSError:
+                pass
+        t_write = min(t_write, t1-t0) if k else t1-t0
+        t_import = min(t_import, t2-t1) if k else t2-t1
+    return module, t_write, t_import
+
+def valid_input(p, a, make_input, size):
+    """Return an input of about `size` tokens which `p` accepts.
+
+    If no valid input is found within 10 tries, None is returned.
+    """
+    for seed in range(1, 11):
+        tokens = make_input(a, size, seed)
+        try:
+            p.parse(tokens)
+        except p.ParseErrors:
+            continue
+        return tokens
+    return None
+
+def recovery_time(p, tokens):
+    """Average time to recover from an error in the middle of `tokens`.
+
+    `p` must be an instrumented parser.  An invalid token is inserted
+    into the input and the time spent on error recovery is taken from
+    the statistics of the parser.  If no invalid token can be found,
+    None is returned.
+    """
+    mid = len(tokens)//2
+    for X in p.terminals:
+        bad = tokens[:mid] + [ (X,) ] + tokens[mid:]
+        p.reset_stats()
+        try:
+            p.parse(bad)
+        except p.ParseErrors:
+            break
+    else:
+        return None
+    p.reset_stats()
+    for k in range(0, 5):
+        try:
+            p.parse(bad)
+        except p.ParseErrors:
+            pass
+    return p.stats["recovery_time"]/p.stats["recoveries"]
+
+def run(name, read, make_input, tables, size, testdir):
+    """Run one benchmark and return a dictionary of results."""
+    res = {}
+    def check(g, params):
+        a = Automaton(g, params)
+        t0 = time()
+        a.check()
+        t = time() - t0
+        res["generate"] = min(res.get("generate", t), t)
+        return a
+    # grammars with conflicts print error messages and exit
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+    try:
+        try:
+            for k in range(0, REPEAT):
+                a, params = read(check)
+        except SystemExit:
+            return None
+    finally:
+        sys.stderr = stderr
+    res["states"] = len(a.states)
+
+    params["tables"] = tables
+    module, res["write"], res["import"] = import_parser(testdir, "benchp",
+                                                        a, params)
+    params["parser_stats"] = True
+    stats_module = import_parser(testdir, "benchps", a, params)[0]
+
+    p = module.Parser()
+    tokens = valid_input(p, a, make_input, size)
+    if tokens is None:
+        # conflict overrides can make random sentences invalid
+        res["tokens"] = 0
+        res["parse_rate"] = res["recovery"] = None
+        return res
+    res["tokens"] = len(tokens)
+    rounds = max(1, 20000//max(1, len(tokens)))
+    def parse():
+        for k in range(0, rounds):
+            p.parse(tokens)
+    res["parse_rate"] = rounds*len(tokens)/best_time(parse)
+
+    tokens = valid_input(p, a, make_input, 100)
+    if tokens is None:
+        res["recovery"] = None
+    else:
+        res["recovery"] = recovery_time(stats_module.Parser(), tokens)
+    return res
+
+def fmt(metric, value):
+    if value is None:
+        return "-"
+    if metric in TIMES:
+        return "%.2fms"%(1000*value)
+    return "%.0f/s"%value
+
+def run_all(options):
+    if options.quick:
+        size = 2000
+    else:
+        size = 20000
+    results = {}
+    testdir = mkdtemp()
+    # as in the `timeit` module, garbage collection is disabled to
+    # make the timings more reproducible
+    gc.disable()
+    try:
+        for name, (read, make_input) in all_benchmarks(options.quick):
+            res = run(name, read, make_input, options.tables, size, testdir)
+            if res is None:
+                print "%-28s skipped (grammar has errors)"%name
+                continue
+            results[name] = res
+            print "%-28s %5d states, %6d tokens"%(name, res["states"],
+                                                  res["tokens"])
+            print "    "+"  ".join("%s %s"%(m, fmt(m, res[m]))
+                                   for m in METRICS)
+            gc.collect()
+    finally:
+        gc.enable()
+        rmdir(testdir)
+    return {
+        "format": FORMAT,
+        "version": VERSION,
+        "python": sys.version.split()[0],
+        "tables": options.tables,
+        "benchmarks": results,
+        }
+
+
+######################################################################
+# comparison of two runs
+
+def compare(old, new, threshold):
+    """Print a comparison of two runs and return the number of regressions."""
+    regressions = 0
+    names = sorted(set(old["benchmarks"]) & set(new["benchmarks"]))
+    for name in names:
+        r0 = old["benchmarks"][name]
+        r1 = new["benchmarks"][name]
+        lines = []
+        for m in METRICS:
+            v0 = r0.get(m)
+            v1 = r1.get(m)
+            if not v0 or not v1:
+                continue
+            if m in TIMES:
+                if max(v0, v1) < MIN_TIME:
+                    continue
+                change = v1/v0 - 1
+                worse = change > threshold
+            else:
+                change = v1/v0 - 1
+                worse = -change/(1+change) > threshold
+            if worse:
+                mark = "  REGRESSION"
+                regressions += 1
+            else:
+                mark = ""
+            lines.append("    %-11s %10s -> %10s  %+6.1f%%%s"%(
+                    m, fmt(m, v0), fmt(m, v1), 100*change, mark))
+        if lines:
+            print name
+            for l in lines:
+                print l
+    for name in sorted(set(old["benchmarks"]) - set(new["benchmarks"])):
+        print "%s: missing in the new run"%name
+    return regressions
+
+
+######################################################################
+# main program
+
+getopt = OptionParser("usage: %prog [options]\n"
+                      "       %prog --compare OLD NEW")
+getopt.add_option("--compare", action="store_true", dest="compare_flag",
+                  help="compare two result files")
+getopt.add_option("-o", "--output", action="store", dest="output_fname",
+                  help="store the results in NAME", metavar="NAME")
+getopt.add_option("-q", "--quick", action="store_true", dest="quick",
+                  help="use fewer and smaller benchmarks")
+getopt.add_option("--tables", action="store", type="choice",
+                  dest="tables", default="dict",
+                  choices=["dict", "dense", "packed"],
+                  help="layout of the parser tables (default: %default)",
+                  metavar="KIND")
+getopt.add_option("--threshold", action="store", type="float",
+                  dest="threshold", default=0.2,
+                  help="relative change which counts as a regression"
+                  " (default: %default)",
+                  metavar="X")
+(options,args)=getopt.parse_args()
+
+if options.compare_flag:
+    if len(args) != 2:
+        getopt.error("--compare needs two result files")
+    old, new = [ json.load(open(fname)) for fname in args ]
+    for data in [ old, new ]:
+        if data.get("format") != FORMAT:
+            getopt.error("unsupported result file format")
+    if old["tables"] != new["tables"]:
+        print "warning: comparing different table layouts"
+    n = compare(old, new, options.threshold)
+    if n:
+        print "%d regressions"%n
+        raise SystemExit(1)
+    print "no regressions"
+    raise SystemExit(0)
+
+if args:
+    getopt.error("too many command line arguments")
+data = run_all(options)
+if options.output_fname is not None:
+    fd = open(options.output_fname, "w")
+    json.dump(data, fd, indent=2, separators=(",", ": "), sort_keys=True)
+    fd.write("\n")
+    fd.close()
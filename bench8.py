@@ -0,0 +1,259 @@
+#! /usr/bin/env python
+# bench8.py - time the merging of states in the LR(1) construction
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Time the construction of LR(1) automatons.
+
+When a new state is generated, Pager's algorithm looks for an
+existing state it can be merged with.  Wisent indexes the existing
+states by their core (the set of kernel items), so that only states
+with the same core are compared.  This script compares the index to
+the linear search over all states reached by the same symbol, which
+was used in earlier versions, for the example grammars and for
+towers of binary operators with many precedence levels and for
+grammars with many kinds of statements, where one symbol occurs in
+many different contexts.  For both methods, the number of
+compatibility checks between pairs of states and the time for
+constructing and checking the automaton are given.  The generated
+parsers are checked to be identical.
+"""
+
+import sys
+from glob import glob
+from os.path import dirname, join
+from StringIO import StringIO
+from time import time
+
+from grammar import Grammar, read_grammar
+from automaton import Automaton, StateIndex
+
+
+class CountingAutomaton(Automaton):
+
+    """Count the compatibility checks between states."""
+
+    def _is_compatible(self, S, T):
+        self.comparisons += 1
+        return Automaton._is_compatible(S, T)
+
+    def __init__(self, g, params={}):
+        Automaton.__init__(self, g, params)
+        self.comparisons = 0
+
+class OldAutomaton(CountingAutomaton):
+
+    def _generate_lr1_tables(self):
+        """The state generation from Wisent 0.6.2.
+
+        Every new state is compared to all existing states which are
+        reached by the same symbol.  The lists of candidates are
+        processed in order of creation, as in the current version.
+        """
+        self._number_items()
+        items = self.items
+        info = self.item_info
+
+        state_tab = {}
+        self.initial_state = StateIndex(0)
+        key, l = self.g.rule_from_head[self.g.start][0]
+        state_tab[self.initial_state] = {
+            self.item_id[(key,l,1)]: self.lookahead_bit[self.g.EOF]
+        }
+
+        maybe_compatible = {}
+        for X in self.g.symbols:
+            maybe_compatible[X] = []
+
+        todo = set([self.initial_state])
+        done = set()
+
+        reduce_tab = {}
+        shift_tab = {}
+
+        created = 1
+        merged = 0
+        regenerated = 0
+        while todo:
+            state_no = todo.pop()
+            done.add(state_no)
+
+            rtab = reduce_tab.setdefault(state_no,{})
+            stab = shift_tab.setdefault(state_no,{})
+
+            state = self._closure(state_tab[state_no])
+            shift = {}
+            for item,ctx in state.iteritems():
+                i = info[item]
+                if i is None:
+                    # reduce using rule 'key'
+                    rtab[items[item][0]] = ctx
+                else:
+                    # shift symbol i[0]
+                    X_neighbour = shift.setdefault(i[0], {})
+                    X_neighbour[item+1] = X_neighbour.get(item+1, 0) | ctx
+
+            for X,S in shift.iteritems():
+                for Tn in maybe_compatible[X]:
+                    T = state_tab[Tn]
+                    if not self._is_compatible(S, T):
+                        continue
+                    # merge S into T
+                    stab[X] = Tn
+                    merged += 1
+                    changed = False
+                    for item in S:
+                        add = S[item] & ~T[item]
+                        if add:
+                            T[item] |= add
+                            changed = True
+                    if changed and Tn in done:
+                        # regenerate the neighbours of T as needed
+                        done.remove(Tn)
+                        del shift_tab[Tn]
+                        del reduce_tab[Tn]
+                        todo.add(Tn)
+                        regenerated += 1
+                    break
+                else:
+                    # create a new state for S
+                    next_state = StateIndex(created)
+                    created += 1
+                    stab[X] = next_state
+                    state_tab[next_state] = S
+                    maybe_compatible[X].append(next_state)
+                    todo.add(next_state)
+                    if X == self.g.EOF:
+                        self.halting_state = next_state
+
+        # throw away unused states (might happen when regeneration of
+        # states was needed).
+        todo = set([self.initial_state])
+        used_states = set()
+        while todo:
+            n = todo.pop()
+            used_states.add(n)
+            todo.update(set(shift_tab[n].values())-used_states)
+        unused = set(state_tab.keys())-used_states
+        for s in unused:
+            del state_tab[s]
+            del reduce_tab[s]
+            del shift_tab[s]
+
+        stats = self.stats
+        stats.set("states_created", created)
+        stats.set("states_merged", merged)
+        stats.set("states_regenerated", regenerated)
+        stats.set("states_unused", len(unused))
+
+        keyfn = lambda x: (x == self.halting_state,min(state_tab[x]))
+        states = sorted(used_states, key=keyfn)
+        for k, s in enumerate(states):
+            s.set_label(k)
+        assert repr(self.initial_state) == "0"
+
+        # convert back from item numbers and bitmasks
+        def convert(U):
+            return dict((items[item],self._lookahead_set(ctx))
+                        for item,ctx in U.iteritems())
+        self.states = states
+        self.state_tab = {}
+        self.reduce_tab = {}
+        self.closure_tab = {}
+        for state in states:
+            self.state_tab[state] = convert(state_tab[state])
+            self.reduce_tab[state] = dict(
+                (key,self._lookahead_set(ctx))
+                for key,ctx in reduce_tab[state].iteritems())
+            self.closure_tab[state] = convert(self._closure(state_tab[state]))
+        self.shift_tab = shift_tab
+        stats.set("closure_calls", self.closure_calls)
+
+
+def expr_tower(levels):
+    rules = []
+    for k in range(0, levels):
+        X = "e%d"%k
+        Y = "e%d"%(k+1)
+        rules.append((X, X, "op%d"%k, Y))
+        rules.append((X, Y))
+    X = "e%d"%levels
+    rules.append((X, "NUM"))
+    rules.append((X, "(", "e0", ")"))
+    return Grammar(rules), {}
+
+def check(g, params):
+    Automaton(g, params).check()
+    return g
+
+def statements(n):
+    rules = [
+        ("stmts", "stmts", "stmt"),
+        ("stmts", "stmt"),
+        ("expr", "expr", "+", "NAME"),
+        ("expr", "NAME"),
+        ]
+    for k in range(0, n):
+        rules.append(("stmt", "kw%d"%k, "NAME", "=", "expr", ";"))
+    return Grammar(rules), {}
+
+def read_example(fname):
+    params = { "fname": fname }
+    lines = unicode(open(fname).read(), "utf-8").splitlines()
+    # grammars with conflicts print error messages and exit
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+    try:
+        try:
+            return read_grammar(lines, params, check), params
+        except SystemExit:
+            return None
+    finally:
+        sys.stderr = stderr
+
+def generate(cls, g, params):
+    a = cls(g, params)
+    t0 = time()
+    a.check()
+    t = time() - t0
+    fd = StringIO()
+    a.write_parser(fd, dict(params, date="-"))
+    return t, a.comparisons, fd.getvalue(), len(a.states)
+
+base = dirname(__file__) or "."
+fnames = glob(join(base, "examples", "*.wi"))
+fnames += glob(join(base, "examples", "*", "*.wi"))
+tests = [ (fname[len(base)+1:], read_example(fname))
+          for fname in sorted(fnames) ]
+tests += [ ("expr-tower-%d"%n, expr_tower(n)) for n in [ 10, 20, 40, 80 ] ]
+tests += [ ("statements-%d"%n, statements(n)) for n in [ 100, 200, 400 ] ]
+
+print "%-34s %6s %19s %19s"%("grammar", "states", "linear search",
+                             "index by core")
+differ = False
+for name, res in tests:
+    if res is None:
+        continue
+    g, params = res
+    t1, c1, out1, n = generate(OldAutomaton, g, params)
+    t2, c2, out2, n = generate(CountingAutomaton, g, params)
+    print "%-34s %6d %8d %9.3fs %8d %9.3fs"%(name, n, c1, t1, c2, t2)
+    if out1 != out2:
+        print "  the generated parsers differ!"
+        differ = True
+if differ:
+    raise SystemExit(1)
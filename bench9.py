@@ -0,0 +1,185 @@
+#! /usr/bin/env python
+# bench9.py - time the computation of closures of LR(1) states
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Time the computation of closures during LR(1) table generation.
+
+The closure of every state is needed when the state is first
+processed, again whenever lookaheads are merged into the state and
+it is regenerated, and once more for the final tables.  Wisent
+computes the closure of each core only once, together with links
+which show how lookaheads propagate from the kernel items, and then
+only combines lookahead masks.  This script compares this to
+computing every closure from scratch, for the example grammars and
+for grammars in which many states need to be regenerated.  The
+number of closures, of distinct cores and of regenerated states
+and the time spent computing closures and the total time for
+constructing and checking the automaton are given.  The generated
+parsers are checked to be identical.
+
+Only the time spent computing closures is reduced, and only for
+states which are regenerated.  For most grammars this is a small
+part of the total time, which is dominated by the search for
+compatible states.
+"""
+
+import sys
+from glob import glob
+from os.path import dirname, join
+from StringIO import StringIO
+from time import time
+
+from grammar import Grammar, Conflicts, read_grammar
+from automaton import Automaton
+from helpers import Stats
+
+
+class TimedAutomaton(Automaton):
+
+    """Measure the time spent computing closures."""
+
+    closure = Automaton._closure
+
+    def __init__(self, g, params={}):
+        Automaton.__init__(self, g, params)
+        self.closure_time = 0
+
+    def _closure(self, U):
+        t0 = time()
+        res = self.closure(U)
+        self.closure_time += time() - t0
+        return res
+
+class OldAutomaton(TimedAutomaton):
+
+    def closure(self, U):
+        """Compute a closure from scratch, as before the memo by core.
+
+        This is the closure computation used before closures were
+        memoised by core, ported to the current representation of
+        items and lookahead masks.
+        """
+        info = self.item_info
+        self.closure_calls += 1
+
+        todo = U.copy()
+        res = U.copy()
+        while todo:
+            item,ctx = todo.popitem()
+            i = info[item]
+            if i is None:
+                continue
+            X, first, nullable, start = i
+            if nullable:
+                lookahead = first | ctx
+            else:
+                lookahead = first
+            for item in start:
+                old = res.get(item, 0)
+                new = lookahead & ~old
+                if new:
+                    res[item] = old | new
+                    todo[item] = todo.get(item, 0) | new
+        return res
+
+
+def brackets(n, levels=10):
+    # expressions with many precedence levels and n kinds of
+    # brackets: the states inside the brackets are merged, and each
+    # merge adds a new closing bracket to the lookaheads
+    rules = []
+    for k in range(0, levels):
+        X = "e%d"%k
+        Y = "e%d"%(k+1)
+        rules.append((X, X, "op%d"%k, Y))
+        rules.append((X, Y))
+    X = "e%d"%levels
+    rules.append((X, "-", X))
+    rules.append((X, "NAME"))
+    for k in range(0, n):
+        rules.append((X, "open%d"%k, "e0", "close%d"%k))
+    return Grammar(rules), {}
+
+def check(g, params):
+    Automaton(g, params).check()
+    return g
+
+def read_example(fname):
+    params = { "fname": fname }
+    lines = unicode(open(fname).read(), "utf-8").splitlines()
+    # grammars with conflicts print error messages and exit
+    stderr = sys.stderr
+    sys.stderr = StringIO()
+    try:
+        try:
+            return read_grammar(lines, params, check), params
+        except SystemExit:
+            return None
+    finally:
+        sys.stderr = stderr
+
+def generate(cls, g, params, repeat=3):
+    best = None
+    best_closure = None
+    for k in range(0, repeat):
+        stats = Stats()
+        a = cls(g, dict(params, stats=stats))
+        t0 = time()
+        try:
+            a.check()
+        except Conflicts:
+            return None
+        t = time() - t0
+        if best is None or t < best:
+            best = t
+        if best_closure is None or a.closure_time < best_closure:
+            best_closure = a.closure_time
+    fd = StringIO()
+    a.write_parser(fd, dict(params, date="-"))
+    return best_closure, best, len(a.states), stats.counters, fd.getvalue()
+
+base = dirname(__file__) or "."
+fnames = glob(join(base, "examples", "*.wi"))
+fnames += glob(join(base, "examples", "*", "*.wi"))
+tests = [ (fname[len(base)+1:], read_example(fname))
+          for fname in sorted(fnames) ]
+tests += [ ("brackets-%d"%n, brackets(n)) for n in [ 10, 20, 40 ] ]
+
+print "%-34s %6s %6s %6s %6s %17s %17s"%("grammar", "states", "regen",
+                                         "calls", "cores", "from scratch",
+                                         "memo by core")
+differ = False
+for name, res in tests:
+    if res is None:
+        continue
+    g, params = res
+    res1 = generate(OldAutomaton, g, params)
+    res2 = generate(TimedAutomaton, g, params)
+    if res1 is None or res2 is None:
+        print "%-34s %s"%(name, "conflicts")
+        continue
+    s1, t1, n, c1, out1 = res1
+    s2, t2, n, c2, out2 = res2
+    print "%-34s %6d %6d %6d %6d %7.3fs %7.3fs %7.3fs %7.3fs"%(
+        name, n, c2["states_regenerated"], c2["closure_calls"],
+        c2["closure_cores"], s1, t1, s2, t2)
+    if out1 != out2:
+        print "  the generated parsers differ!"
+        differ = True
+if differ:
+    raise SystemExit(1)
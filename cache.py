@@ -0,0 +1,119 @@
+# cache.py - an on-disk cache for parser tables
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import os
+import cPickle
+from os.path import expanduser, join
+from tempfile import mkstemp
+
+
+def default_cache_dir():
+    """Return the default location of the table cache.
+
+    This is the directory "wisent" inside `$XDG_CACHE_HOME`, or inside
+    "~/.cache" if this variable is not set.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or expanduser("~/.cache")
+    return join(base, "wisent")
+
+
+class TableCache(object):
+
+    """Store the parser tables of previously seen grammars on disk.
+
+    Every cache entry is a file in the cache directory, named after
+    the key returned by `Automaton.cache_key`.  When the total size
+    of all entries exceeds `max_size` bytes, the least recently used
+    entries are removed.
+
+    The cache is only an optimisation: all errors while reading or
+    writing cache entries are silently ignored.
+    """
+
+    suffix = ".cache"
+
+    def __init__(self, dirname=None, max_size=32*1024*1024):
+        if dirname is None:
+            dirname = default_cache_dir()
+        self.dirname = dirname
+        self.max_size = max_size
+
+    def _fname(self, key):
+        return join(self.dirname, key+self.suffix)
+
+    def get(self, key):
+        """Return the data stored under `key`, or None."""
+        fname = self._fname(key)
+        try:
+            fd = open(fname, "rb")
+            try:
+                data = cPickle.load(fd)
+            finally:
+                fd.close()
+            # mark the entry as recently used
+            os.utime(fname, None)
+        except Exception:
+            # missing or damaged entries are treated as cache misses
+            return None
+        return data
+
+    def put(self, key, data):
+        """Store `data` under `key` and evict old entries if needed."""
+        try:
+            if not os.path.isdir(self.dirname):
+                os.makedirs(self.dirname)
+            # write to a temporary file first, so that concurrent runs
+            # never see incomplete entries
+            fd, tmpname = mkstemp(suffix=".tmp", dir=self.dirname)
+            fd = os.fdopen(fd, "wb")
+            try:
+                cPickle.dump(data, fd, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                fd.close()
+            os.rename(tmpname, self._fname(key))
+        except (IOError, OSError):
+            return
+        self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits."""
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.dirname)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(self.suffix):
+                continue
+            fname = join(self.dirname, name)
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fname))
+            total += st.st_size
+        entries.sort()
+        for mtime, size, fname in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+            total -= size
@@ -22,8 +22,10 @@ from os import remove, rmdir
 from os.path import join
 from tempfile import mkdtemp
 
-from grammar import Grammar
+from grammar import Grammar, read_grammar
 from automaton import Automaton
+from cache import TableCache
+from helpers import Stats
 
 
 testdir = mkdtemp()
@@ -51,58 +53,131 @@ EOF = FakeEOF()
 ignore = object()
 
 def check(rules, tests, parser_args={}):
+    # the optional parts of the parser are only compiled in for the
+    # last run, all other runs use the parser generated by default
+    for tables in [ "dict", "dense", "packed", "file", "lalr", "cache",
+                    "features" ]:
+        check_tables(rules, tests, parser_args, tables)
+
+def check_tables(rules, tests, parser_args, tables):
     print "-"*70
+    print "tables: "+tables
     g = Grammar(rules)
-    a = Automaton(g)
+    if tables == "lalr":
+        a = Automaton(g, { "method": "lalr" })
+    elif tables == "cache":
+        # store the tables in a cache and use them for a new automaton
+        cache = TableCache(testdir)
+        a = Automaton(g)
+        a.check()
+        cache.put(a.cache_key(), a.cache_data())
+        g = Grammar(rules)
+        a = Automaton(g)
+        a.load_cache_data(cache.get(a.cache_key()))
+        remove(join(testdir, a.cache_key()+cache.suffix))
+    else:
+        a = Automaton(g)
+    if tables == "file":
+        params = { "tables_file": "tmp.tab" }
+        fd = open(join(testdir,"tmp.tab"), "wb")
+        a.write_tables(fd)
+        fd.close()
+    elif tables in [ "lalr", "cache", "features" ]:
+        params = {}
+    else:
+        params = { "tables": tables }
+    params["transparent_tokens"] = frozenset(r[0] for r in rules
+                                             if str(r[0]).startswith("_"))
+    features = tables == "features"
+    params["parser_many"] = features
+    params["parser_arena"] = features
+    params["parser_actions"] = features or "actions" in parser_args
     fd = open(join(testdir,"tmp.py"), "w")
-    a.write_parser(fd)
+    a.write_parser(fd, params)
     fd.close()
     del a, g
 
     import tmp
     reload(tmp)
     p = tmp.Parser(**parser_args)
+    methods = [ "parse", "feed" ]
+    if features:
+        methods.append("parse_many")
+        if "actions" not in parser_args:
+            pa = tmp.Parser(arena=True, **parser_args)
+            methods.append("arena")
 
     EOF.set_real_eof(p.EOF)
 
-    for input,e_tree,e_err in tests:
+    if features:
+        # all inputs are parsed at once, using two worker processes
+        inputs = [ [ (x,k) for k,x in enumerate(t[0]) ] for t in tests ]
+        many = list(p.parse_many(inputs, workers=2, chunksize=1))
+    else:
+        many = [ None ]*len(tests)
+
+    for (input,e_tree,e_err), res in zip(tests, many):
         e_err = [ (x[0], frozenset(x[1])) for x in e_err ]
 
         print "input: "+repr(input)
-        try:
-            tree = p.parse((x,k) for k,x in enumerate(input))
-            err = []
-        except p.ParseErrors, e:
-            tree = e.tree
-            err = e.errors
-            err = [ (x[0], frozenset(x[1])) for x in err ]
-
-        success = True
-        for e in e_err:
-            if e not in err:
-                print "  missed error: "+repr(e)
+        for method in methods:
+            tokens = [ (x,k) for k,x in enumerate(input) ]
+            missing = []
+            try:
+                if method == "parse_many":
+                    if isinstance(res, p.ParseErrors):
+                        raise res
+                    tree = res
+                elif method == "parse":
+                    tree = p.parse(iter(tokens))
+                elif method == "arena":
+                    tree = pa.parse(iter(tokens)).to_tuples()
+                else:
+                    # push the tokens into the parser one by one; for
+                    # valid input, every token must be expected
+                    for x in tokens+[(p.EOF,)]:
+                        if not e_err and x[0] not in p.expected():
+                            missing.append(x[0])
+                        if x[0] != p.EOF:
+                            p.feed([x])
+                    tree = p.finish()
+                err = []
+            except p.ParseErrors, e:
+                tree = e.tree
+                if method == "arena" and tree is not None:
+                    tree = tree.to_tuples()
+                err = e.errors
+                err = [ (x[0], frozenset(x[1])) for x in err ]
+
+            success = True
+            for x in missing:
+                print "  not expected: "+repr(x)
                 success = False
-        for e in err:
-            if e not in e_err:
-                print "  unexpected error: "+repr(e)
+            for e in e_err:
+                if e not in err:
+                    print "  missed error: "+repr(e)
+                    success = False
+            for e in err:
+                if e not in e_err:
+                    print "  unexpected error: "+repr(e)
+                    success = False
+            if e_tree != ignore and tree != e_tree:
+                print "  unexpected result:"
+                print "    expected: "+repr(e_tree)
+                print "    got: "+repr(tree)
                 success = False
-        if e_tree != ignore and tree != e_tree:
-            print "  unexpected result:"
-            print "    expected: "+repr(e_tree)
-            print "    got: "+repr(tree)
-            success = False
 
-        if success:
-            print "  success"
-        else:
-            print "  failure"
-            global errors
-            errors += 1
-    try:
-        remove(join(testdir,"tmp.py"))
-        remove(join(testdir,"tmp.pyc"))
-    except OSError:
-        pass
+            if success:
+                print "  %s: success"%method
+            else:
+                print "  %s: failure"%method
+                global errors
+                errors += 1
+    for fname in [ "tmp.py", "tmp.pyc", "tmp.tab" ]:
+        try:
+            remove(join(testdir,fname))
+        except OSError:
+            pass
 
 
 rules = [
@@ -132,6 +207,25 @@ tests = [
 check(rules, tests)
 
 
+# check transparent repetitions
+rules = [
+    ('A', '_list', 0),
+    ('_list',),
+    ('_list', '_list', '_item'),
+    ('_item', 1),
+    ('_item', 2, 'B'),
+    ('B', 3),
+    ]
+tests = [
+    ([0], ('A', (0,0)), []),
+    ([1, 2, 3, 1, 0], ('A', (1,0), (2,1), ('B', (3,2)), (1,3), (0,4)), []),
+    ([1]*20+[0], ('A',)+tuple((1,k) for k in range(0, 20))+((0,20),), []),
+    ([1, 3, 1, 0], ('A', (1,0), (2,), ('B', (3,1)), (1,2), (0,3)),
+     [((3,1), [0, 1, 2])]),
+    ]
+check(rules, tests)
+
+
 rules = [
     ('A', 0, 1, 2, 3),
     ]
@@ -185,6 +279,260 @@ tests = [
     ]
 check(rules, tests, {'errcorr_post':3})
 
+# check errcorr_budget
+tests = [
+    ([3, 0, 0, 2], ('A', (1,), (0,1), (0,2), (1,)), [((3,0), [1, 2]),
+                                                     ((2,3), [1])]),
+    ]
+check(rules, tests, {'errcorr_post':3, 'errcorr_budget':3})
+
+tests = [
+    ([3, 0, 0, 2], None, [((3,0), [1, 2])]),
+    ]
+check(rules, tests, {'errcorr_post':3, 'errcorr_budget':0})
+
+# check semantic actions
+rules = [
+    ('S', 'sum', '_list'),
+    ('sum', 'sum', '+', 'num'),
+    ('sum', 'num'),
+    ('_list', ),
+    ('_list', '_list', 'num'),
+    ('num', 1),
+    ('num', 2),
+    ]
+actions = {
+    'sum': lambda *args: args[0] if len(args) == 1 else args[0]+args[2],
+    'num': lambda t: t[0],
+    }
+
+tests = [
+    ([1], ('S', 1), []),
+    ([1, '+', 2, '+', 2], ('S', 5), []),
+    ([1, 2, 2, 1], ('S', 1, 2, 2, 1), []),
+    ([2, '+', 1, 1, 2], ('S', 3, 1, 2), []),
+    ([2, '+', '+', 1], ('S', 4), [(('+',2), [1, 2])]),
+    ]
+check(rules, tests, {'actions':actions})
+
+# check arena trees, cursors and parallel parsing into arenas
+print "-"*70
+print "arena trees"
+rules = [
+    ('A', '_list', 0),
+    ('_list',),
+    ('_list', '_list', '_item'),
+    ('_item', 1),
+    ('_item', 2, 'B'),
+    ('B', 3),
+    ]
+fd = open(join(testdir,"tmp.py"), "w")
+Automaton(Grammar(rules)).write_parser(fd, {
+        "transparent_tokens": frozenset([ '_list', '_item' ]),
+        "parser_many": True, "parser_arena": True })
+fd.close()
+import tmp
+reload(tmp)
+p = tmp.Parser(arena=True)
+
+def walk(c):
+    """Convert the tree below a cursor into tuples."""
+    if c.is_leaf:
+        return c.token
+    res = [ c.symbol ]
+    if c.goto_first_child():
+        res.append(walk(c))
+        while c.goto_next_sibling():
+            res.append(walk(c))
+        c.goto_parent()
+    return tuple(res)
+
+inputs = [ [1, 2, 3, 1, 0], [0], [2, 3]*20+[0] ]
+inputs = [ [ (x,k) for k,x in enumerate(input) ] for input in inputs ]
+many = list(p.parse_many(inputs, workers=2))
+for input, res in zip(inputs, many):
+    print "input: "+repr([ x[0] for x in input ])
+    for x in input[:2]:
+        p.feed([x])
+    p.feed(input[2:])
+    tree = p.finish()
+    e_tree = tree.to_tuples()
+    success = True
+    if len(tree.symbol) != 1+sum(1 for x in input if x[0] == 3):
+        print "  unexpected number of nodes: %d"%len(tree.symbol)
+        success = False
+    if walk(tree.cursor()) != e_tree:
+        print "  cursor walk failed"
+        success = False
+    if list(tree.leaves()) != input:
+        print "  leaves differ"
+        success = False
+    if res.to_tuples() != e_tree:
+        print "  parse_many returned "+repr(res.to_tuples())
+        success = False
+    if success:
+        print "  arena: success"
+    else:
+        print "  arena: failure"
+        errors += 1
+
+# check the statistics collected during table generation
+print "-"*70
+print "statistics"
+for method in [ "lr1", "lalr" ]:
+    stats = Stats()
+    a = Automaton(Grammar(rules), { "method": method, "stats": stats })
+    fd = open(join(testdir,"tmp.py"), "w")
+    a.write_parser(fd, { "tables": "dense" })
+    fd.close()
+    c = stats.counters
+    success = True
+    if c["states"] != len(a.states):
+        print "  %s: %d states reported, %d expected"%(method, c["states"],
+                                                     len(a.states))
+        success = False
+    if method == "lr1":
+        e_states = c["states_created"] - c["states_unused"]
+        if c["states"] != e_states:
+            print "  %s: inconsistent state counts %s"%(method, repr(c))
+            success = False
+    if c["shift_entries"] != len(a.stab) or c["closure_calls"] < 1:
+        print "  %s: unexpected counters %s"%(method, repr(c))
+        success = False
+    e_phases = [ "generate_tables", "check" ]
+    if stats.phases != e_phases:
+        print "  %s: phases %s, expected %s"%(method, repr(stats.phases),
+                                              repr(e_phases))
+        success = False
+    if success:
+        print "  %s: success"%method
+    else:
+        print "  %s: failure"%method
+        errors += 1
+
+# check that grammar files are analysed again only where they changed
+print "-"*70
+print "grammar memo"
+source = [ u"s: a* ( 'x' | 'y' ) ;", u"a: 'z' ;" ]
+memo = {}
+g1 = read_grammar(source, { "memo": memo })
+g2 = read_grammar(source + [ u"# comment" ], { "memo": memo })
+g3 = read_grammar(source, {})
+g4 = read_grammar(source[:1] + [ u"a: 'w' ;" ], { "memo": memo })
+success = True
+if g2 is not g1:
+    print "  grammar not reused after adding a comment"
+    success = False
+if repr(g3.rules) != repr(g1.rules):
+    print "  invented names differ: %s, %s"%(repr(g1.rules), repr(g3.rules))
+    success = False
+if g4 is g1 or ("a", "w") not in g4.rules.values():
+    print "  changed rules not picked up: %s"%repr(g4.rules)
+    success = False
+if success:
+    print "  success"
+else:
+    print "  failure"
+    errors += 1
+
+# check that optional parts of the parser are only emitted on request
+print "-"*70
+print "optional parser code"
+fd = open(join(testdir,"tmp.py"), "w")
+Automaton(Grammar(rules)).write_parser(fd)
+fd.close()
+reload(tmp)
+source = open(join(testdir,"tmp.py")).read()
+success = True
+for name in [ "parse_many", "Arena", "Cursor", "_apply_action",
+              "_Children" ]:
+    if name in source:
+        print "  %s not compiled out"%name
+        success = False
+try:
+    tmp.Parser(arena=True)
+    print "  arena=True accepted without arena support"
+    success = False
+except ValueError:
+    pass
+try:
+    tmp.Parser(actions={})
+    print "  actions accepted without support for actions"
+    success = False
+except ValueError:
+    pass
+if success:
+    print "  success"
+else:
+    print "  failure"
+    errors += 1
+
+# check the counters of instrumented parsers
+print "-"*70
+print "parser instrumentation"
+e_reductions = { ('A', 2): 1, ('_list', 0): 1, ('_list', 2): 2,
+                 ('_item', 1): 1, ('_item', 2): 1, ('B', 1): 1 }
+for tables in [ "dict", "dense", "packed" ]:
+    for parser_stats in [ False, True ]:
+        fd = open(join(testdir,"tmp.py"), "w")
+        Automaton(Grammar(rules)).write_parser(fd, {
+                "tables": tables, "parser_stats": parser_stats,
+                "transparent_tokens": frozenset([ '_list', '_item' ]) })
+        fd.close()
+        reload(tmp)
+        p = tmp.Parser()
+        success = True
+        if not parser_stats:
+            source = open(join(testdir,"tmp.py")).read()
+            if hasattr(p, "stats") or "stats" in source:
+                print "  %s: statistics not compiled out"%tables
+                success = False
+        else:
+            p.parse([ (1,), (2,), (3,), (0,) ])
+            # the end of input counts as a shifted token
+            if (p.stats["shifts"] != 5 or p.stats["max_depth"] != 3
+                or p.stats["reductions"] != e_reductions
+                or p.stats["recoveries"] != 0):
+                print "  %s: unexpected statistics %s"%(tables,
+                                                       repr(p.stats))
+                success = False
+            p.reset_stats()
+            try:
+                p.parse([ (1,), (2,), (0,) ])
+            except p.ParseErrors, e:
+                pass
+            if p.stats["recoveries"] != 1 or p.stats["repairs_tried"] < 1:
+                print "  %s: unexpected statistics %s"%(tables,
+                                                       repr(p.stats))
+                success = False
+            # every token of the repaired input is counted once
+            bad = [ (1,) ]*30 + [ (3,) ] + [ (1,) ]*10 + [ (0,) ]
+            p.reset_stats()
+            try:
+                p.parse(bad)
+            except p.ParseErrors, e:
+                repaired = list(p.leaves(e.tree))
+            stats = p.stats
+            p.reset_stats()
+            p.parse(repaired)
+            if (stats["shifts"] != len(repaired)+1
+                or stats["reductions"] != p.stats["reductions"]
+                or stats["max_depth"] != p.stats["max_depth"]):
+                print "  %s: %s after an error, %s expected"%(
+                    tables, repr(stats), repr(p.stats))
+                success = False
+        if success:
+            print "  %s, parser_stats=%s: success"%(tables, parser_stats)
+        else:
+            print "  %s, parser_stats=%s: failure"%(tables, parser_stats)
+            errors += 1
+
+for fname in [ "tmp.py", "tmp.pyc" ]:
+    try:
+        remove(join(testdir,fname))
+    except OSError:
+        pass
+
 rmdir(testdir)
 
 if errors:
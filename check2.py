@@ -47,6 +47,38 @@ out3 = [
   ('string', '"', 6, 1)
 ]
 
+in4 = "a-b\t_c: x1|-y ;\n\tz\t# comment\n  #"
+out4 = [
+  ('token', 'a-b', 1, 1),
+  ('token', '_c', 1, 9),
+  (':', ':', 1, 11),
+  ('token', 'x1', 1, 13),
+  ('|', '|', 1, 15),
+  ('-', '-', 1, 16),
+  ('token', 'y', 1, 17),
+  (';', ';', 1, 19),
+  ('token', 'z', 2, 9)
+]
+
+in5 = r"""
+"a\\b\"c" '\
+' ""
+"""
+out5 = [
+  ('string', 'a\\b"c', 2, 1),
+  ('string', '\n', 2, 11),
+  ('string', '', 3, 3)
+]
+
+in6 = u'\xe4\xdf-1: \u20ac "\xe4" ;'
+out6 = [
+  ('token', u'\xe4\xdf-1', 1, 1),
+  (':', ':', 1, 5),
+  (u'\u20ac', u'\u20ac', 1, 7),
+  ('string', u'\xe4', 1, 9),
+  (';', ';', 1, 13)
+]
+
 names = sorted(name for name in dir() if name.startswith("in"))
 for name in names:
     label = name[2:]
@@ -60,3 +92,19 @@ for name in names:
         print "test %s: FAIL"%label
         for t in tt:
             print t
+
+class Source(list):
+    name = "test.wi"
+
+for label, text, e_loc in [ ("7", 'a: "b\n c;\n', (1, 4)),
+                            ("8", "a\n  'b\\", (2, 3)) ]:
+    try:
+        tt = list(tokens(Source(text.splitlines())))
+        loc = None
+    except SyntaxError, e:
+        loc = (e.filename, e.lineno, e.offset)
+    if loc == ("test.wi",)+e_loc:
+        print "test %s: OK"%label
+    else:
+        print "test %s: FAIL"%label
+        print loc
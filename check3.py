@@ -0,0 +1,202 @@
+#! /usr/bin/env python
+# check3.py - check the scanner generator used in Wisent
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import re
+import sys
+from os import remove, rmdir
+from os.path import join
+from tempfile import mkdtemp
+
+from grammar import Grammar
+from automaton import Automaton
+from lexer import read_tokens, TokensError
+
+errors = 0
+
+######################################################################
+# compare the scanner automaton to Python regular expressions
+
+def full_match(scanner, s):
+    state = 0
+    for c in s:
+        state = scanner.rows[state][scanner.char_class(ord(c))]
+        if state < 0:
+            return False
+    return scanner.accept[state] >= 0
+
+patterns = [
+    (r"abc", [ "", "a", "abc", "abcd", "ABC" ]),
+    (r"a|bc|", [ "", "a", "b", "bc", "abc" ]),
+    (r"(ab)*c", [ "c", "abc", "ababc", "abac", "ab" ]),
+    (r"a+b?", [ "a", "aaab", "b", "abb", "" ]),
+    (r"x{2}y{1,3}z{2,}", [ "xxyzz", "xxyyyzzzz", "xyzz", "xxyyyyzz", "xxyz" ]),
+    (r"[a-c0-2_]+", [ "a0_", "c2b1", "d", "3", "-" ]),
+    (r"[^a-c\n]", [ "a", "d", "\n", "-", u"\xe4", u"\u20ac" ]),
+    (r"[-a]|[a-]|[]]|[^]]", [ "-", "a", "]", "x" ]),
+    (r"\d+\.\d*|\.\d+", [ "1.", "12.5", ".5", ".", "1" ]),
+    (r"\w\W\s\S", [ "a- x", "_.\t.", "a-xx", "--  " ]),
+    (ur"\x41\xe4\t\\\.", [ u"A\xe4\t\\.", u"A\xe4 \\." ]),
+    (r".*", [ "", "abc", "a\nb" ]),
+    (r"(a|b)*abb", [ "abb", "aabb", "babb", "ab", "abba" ]),
+    (r"((a|)*)*b", [ "b", "aaab", "" ]),
+    ]
+
+print "check the scanner automaton"
+for pattern, strings in patterns:
+    # patterns for tokens must not match the empty string, so we
+    # append a marker character
+    scanner = read_tokens([ "%define p "+pattern, "T {p}!" ])
+    regex = re.compile("(?:%s)\\Z"%pattern)
+    for s in strings:
+        res = full_match(scanner, s+"!")
+        e_res = regex.match(s) is not None
+        if res != e_res:
+            print "  %s on %s: expected %s, got %s"%(repr(pattern), repr(s),
+                                                     e_res, res)
+            errors += 1
+print "  %d patterns checked"%len(patterns)
+
+# case-insensitive patterns
+scanner = read_tokens([ u"%ignorecase", u"T [a-c]x|\xe4" ])
+for s, e_res in [ ("Ax", True), ("bX", True), ("dx", False),
+                  (u"\xc4", True), (u"\xe4", True) ]:
+    res = full_match(scanner, s)
+    if res != e_res:
+        print "  ignorecase on %s: expected %s, got %s"%(repr(s), e_res, res)
+        errors += 1
+
+######################################################################
+# check the token definitions and splitting of text into tokens
+
+definitions = r"""
+# keywords come before names, so they win for equal lengths
+%define letter [a-zA-Z_]
+"if" "else"
+NAME {letter}({letter}|[0-9])*
+NUM [0-9]+(\.[0-9]+)?
+"=" "==" "<" "<="
+'"' "x"
+%ignore [ \t\n]+|\#.*
+""".splitlines()
+
+text = """if ifx else==x<=3.5<
+  # comment
+2.x"""
+
+e_tokens = [
+    ('if', 'if', 1, 1),
+    ('NAME', 'ifx', 1, 4),
+    ('else', 'else', 1, 8),
+    ('==', '==', 1, 12),
+    ('NAME', 'x', 1, 14),
+    ('<=', '<=', 1, 15),
+    ('NUM', '3.5', 1, 17),
+    ('<', '<', 1, 20),
+    ('NUM', '2', 3, 1),
+    ('.', '.', 3, 2),
+    ('NAME', 'x', 3, 3),
+    ]
+
+print "check the token definitions"
+scanner = read_tokens(definitions)
+tokens = list(scanner.scan(text))
+if tokens != e_tokens:
+    print "  unexpected tokens:"
+    print "    expected: "+repr(e_tokens)
+    print "    got: "+repr(tokens)
+    errors += 1
+
+# the literal token "x" is shadowed by NAME, but still listed
+if scanner.symbols[-3:-1] != [ '"', 'x' ]:
+    print "  unexpected symbols: "+repr(scanner.symbols)
+    errors += 1
+
+bad_definitions = [
+    ([ "A a*" ], 1, 3),
+    ([ "", "A (ab" ], 2, 3),
+    ([ "A ab)" ], 1, 5),
+    ([ "A [ab" ], 1, 3),
+    ([ "A *" ], 1, 3),
+    ([ "A {x}" ], 1, 3),
+    ([ "A a{3,1}" ], 1, 4),
+    ([ "A \\x4" ], 1, 3),
+    ([ "%unknown a" ], 1, 1),
+    ([ "A" ], 1, 2),
+    ([ "# only a comment" ], 2, None),
+    ]
+
+for lines, e_lineno, e_offset in bad_definitions:
+    try:
+        read_tokens(lines)
+        print "  no error for %s"%repr(lines)
+        errors += 1
+    except TokensError, e:
+        if (e.lineno, e.offset) != (e_lineno, e_offset):
+            print "  %s: error at %s:%s, expected %s:%s"%(repr(lines),
+                                                         e.lineno, e.offset,
+                                                         e_lineno, e_offset)
+            errors += 1
+
+######################################################################
+# check the scanner in a generated parser
+
+print "check the generated scanner"
+rules = [
+    ('stmts', 'stmts', 'stmt'),
+    ('stmts', 'stmt'),
+    ('stmt', 'if', 'expr', 'stmt', 'else', 'stmt'),
+    ('stmt', 'NAME', '=', 'expr'),
+    ('expr', 'NAME', '<', 'NUM'),
+    ('expr', 'NAME', '<=', 'NUM'),
+    ('expr', 'NAME', '==', 'NUM'),
+    ]
+testdir = mkdtemp()
+sys.path = [testdir] + sys.path
+fd = open(join(testdir, "tmp3.py"), "w")
+Automaton(Grammar(rules)).write_parser(fd, { "scanner": scanner })
+fd.close()
+import tmp3
+p = tmp3.Parser()
+
+texts = [ text, "", " \t", u"\xe4if\u20ac\n\n  \u20acelse", "\n#\n\nx<=1" ]
+for s in texts:
+    tokens = list(p.scan(s))
+    e_tokens = list(scanner.scan(s))
+    if tokens != e_tokens:
+        print "  scanning %s:"%repr(s)
+        print "    expected: "+repr(e_tokens)
+        print "    got: "+repr(tokens)
+        errors += 1
+
+tree = p.parse(p.scan("if x<1 y=z==2 else if a<=3 b=c<4 else d=e==5"))
+if tree[0] != 'stmts' or len(list(p.leaves(tree))) != 25:
+    print "  unexpected parse tree: "+repr(tree)
+    errors += 1
+
+for fname in [ "tmp3.py", "tmp3.pyc" ]:
+    try:
+        remove(join(testdir, fname))
+    except OSError:
+        pass
+rmdir(testdir)
+
+if errors:
+    print "%d errors"%errors
+    raise SystemExit(1)
+print "all tests passed"
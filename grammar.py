@@ -23,8 +23,82 @@ from inspect import getsource
 
 from text import split_it, write_block
 from scanner import tokens
+from lexer import read_tokens, TokensError
+from helpers import Stats
 from parser import Parser
 import template
+from version import VERSION
+
+
+def digraph(R, F):
+    """Propagate sets along the edges of a graph.
+
+    This implements the "digraph" algorithm from DeRemer and
+    Pennello, 1982.  `R` is a list, giving for every node the list
+    of its successors, and `F` is a list of bitmasks, one per node.
+    On return, `F[x]` is replaced by the union of `F[y]` over all
+    nodes `y` which are reachable from `x`.  The strongly connected
+    components of the graph are found using Tarjan's algorithm, so
+    that the run time is linear in the size of the graph.
+    """
+    infinity = len(R)+1
+    N = [ 0 ] * len(R)
+    stack = []
+    for x0 in range(0, len(R)):
+        if N[x0]:
+            continue
+        stack.append(x0)
+        N[x0] = len(stack)
+        work = [ (x0, len(stack), iter(R[x0])) ]
+        while work:
+            x, d, succ = work[-1]
+            for y in succ:
+                if N[y] == 0:
+                    stack.append(y)
+                    N[y] = len(stack)
+                    work.append((y, len(stack), iter(R[y])))
+                    break
+                N[x] = min(N[x], N[y])
+                F[x] |= F[y]
+            else:
+                work.pop()
+                if N[x] == d:
+                    # x is the root of a strongly connected component
+                    while True:
+                        z = stack.pop()
+                        N[z] = infinity
+                        F[z] = F[x]
+                        if z == x:
+                            break
+                if work:
+                    p = work[-1][0]
+                    N[p] = min(N[p], N[x])
+                    F[p] |= F[x]
+
+
+class _MaskDecoder(object):
+
+    """Convert bitmasks into frozensets of symbols.
+
+    Bit `i` of a mask represents the symbol `symbols[i]`.  Since many
+    symbols share the same set, the results are cached.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.cache = { 0: frozenset() }
+
+    def __call__(self, mask):
+        res = self.cache.get(mask)
+        if res is None:
+            res = set()
+            m = mask
+            while m:
+                low = m & -m
+                res.add(self.symbols[low.bit_length()-1])
+                m ^= low
+            res = self.cache[mask] = frozenset(res)
+        return res
 
 
 def _print_error(msg, lineno=None, offset=None, fname=None):
@@ -267,43 +341,50 @@ class Grammar(object):
     def _cleanup(self):
         """Remove unnecessary rules and symbols."""
         # remove nonterminal symbols which do generate terminals
-        N = set([r[0] for r in self.rules.values() if len(r) == 1])
         T = self.terminals
-        R = self.rules.keys()
-        done = False
-        while not done:
-            done = True
-            for key in R:
-                r = self.rules[key]
-                if r[0] in N:
-                    continue
-                if set(r[1:])&(N|T):
+        N = set()
+        occurs = {}
+        work = []
+        for key, r in self.rules.iteritems():
+            for s in r[1:]:
+                occurs.setdefault(s, []).append(key)
+            if len(r) == 1 or set(r[1:])&T:
+                if r[0] not in N:
                     N.add(r[0])
-                    done = False
+                    work.append(r[0])
+        while work:
+            s = work.pop()
+            for key in occurs.get(s, ()):
+                X = self.rules[key][0]
+                if X not in N:
+                    N.add(X)
+                    work.append(X)
         if self.start not in N:
             tmpl = "start symbol %s doesn't generate terminals"
             raise RulesError(tmpl%repr(self.start))
-        for key in R:
-            if not set(self.rules[key]) <= (N|T):
+        NT = N|T
+        for key in self.rules.keys():
+            if not set(self.rules[key]) <= NT:
                 del self.rules[key]
 
         # remove unreachable symbols
+        by_head = {}
+        for key, r in self.rules.iteritems():
+            by_head.setdefault(r[0], []).append(r)
         gamma = set([self.start])
-        done = False
-        while not done:
-            done = True
-            for key in R:
-                r = self.rules[key]
-                if r[0] not in gamma:
-                    continue
+        work = [ self.start ]
+        while work:
+            X = work.pop()
+            for r in by_head.get(X, ()):
                 for w in r[1:]:
                     if w not in gamma:
                         gamma.add(w)
-                        done = False
+                        work.append(w)
         N &= gamma
         T &= gamma
-        for key in R:
-            if not set(self.rules[key]) <= (N|T):
+        NT = N|T
+        for key in self.rules.keys():
+            if not set(self.rules[key]) <= NT:
                 del self.rules[key]
 
         # generate a terminator symbol
@@ -322,62 +403,111 @@ class Grammar(object):
         self.symbols = N|T
 
     def _compute_nbtab(self):
-        """Compute the set of nullable symbols."""
+        """Compute the set of nullable symbols.
+
+        For every rule we count the symbols on the right-hand side
+        which are not yet known to be nullable.  Whenever a symbol is
+        found to be nullable, the counts of all rules using this
+        symbol are decreased, and the head of a rule becomes nullable
+        once its count drops to zero.
+        """
         nbtab = set()
-        done = False
-        while not done:
-            done = True
-            for key, r in self.rules.iteritems():
-                if r[0] in nbtab:
-                    continue
-                for s in r[1:]:
-                    if s not in nbtab:
-                        break
-                else:
-                    nbtab.add(r[0])
-                    done = False
+        count = {}
+        occurs = {}
+        work = []
+        for key, r in self.rules.iteritems():
+            count[key] = len(r)-1
+            for s in r[1:]:
+                occurs.setdefault(s, []).append(key)
+            if len(r) == 1 and r[0] not in nbtab:
+                nbtab.add(r[0])
+                work.append(r[0])
+        while work:
+            s = work.pop()
+            for key in occurs.get(s, ()):
+                count[key] -= 1
+                if count[key] == 0:
+                    X = self.rules[key][0]
+                    if X not in nbtab:
+                        nbtab.add(X)
+                        work.append(X)
         return nbtab
 
     def _compute_fitab(self):
-        """Compute the table of all possible first symbols in expansions."""
+        """Compute the table of all possible first symbols in expansions.
+
+        A nonterminal `X` inherits the first symbols of `Y`, if there
+        is a rule `X: ... Y ...` where all symbols before `Y` are
+        nullable.  The first symbols are propagated along this
+        relation using `digraph`, with terminals represented by bits.
+        """
+        terminals = list(self.terminals)
+        bit = dict((s, 1<<i) for i,s in enumerate(terminals))
+        nonterminals = list(self.nonterminals)
+        index = dict((X, i) for i,X in enumerate(nonterminals))
+        R = [ [] for X in nonterminals ]
+        F = [ 0 ] * len(nonterminals)
+        for key, r in self.rules.iteritems():
+            i = index[r[0]]
+            for s in r[1:]:
+                if s in index:
+                    R[i].append(index[s])
+                else:
+                    F[i] |= bit[s]
+                if s not in self.nullable:
+                    break
+        digraph(R, F)
+
         fitab = {}
-        for s in self.nonterminals:
-            fitab[s] = set()
-        for s in self.terminals:
-            fitab[s] = set([s])
-        done = False
-        while not done:
-            done = True
-            for key, r in self.rules.iteritems():
-                fi = set()
-                for s in r[1:]:
-                    fi |= fitab[s]
-                    if s not in self.nullable:
-                        break
-                if not(fi <= fitab[r[0]]):
-                    fitab[r[0]] |= fi
-                    done = False
+        decode = _MaskDecoder(terminals)
+        for X,i in index.iteritems():
+            fitab[X] = decode(F[i])
+        for s in terminals:
+            fitab[s] = frozenset([s])
         return fitab
 
     def _compute_fotab(self):
+        """Compute the table of all possible follow-up symbols.
+
+        A symbol `Y` inherits the follow-up symbols of `X`, if there
+        is a rule `X: ... Y ...` where all symbols after `Y` are
+        nullable.  As for `_compute_fitab`, the sets are propagated
+        along this relation using `digraph`.
+        """
+        terminals = list(self.terminals)
+        bit = dict((s, 1<<i) for i,s in enumerate(terminals))
+        fimask = {}
+        for s, fi in self.fitab.iteritems():
+            mask = 0
+            for t in fi:
+                mask |= bit[t]
+            fimask[s] = mask
+        symbols = list(self.nonterminals|self.terminals)
+        index = dict((X, i) for i,X in enumerate(symbols))
+        R = [ [] for X in symbols ]
+        F = [ 0 ] * len(symbols)
+        for key, r in self.rules.iteritems():
+            # walk the right-hand side backwards, keeping track of the
+            # first symbols of the remaining suffix
+            j = index[r[0]]
+            fo = 0
+            tail_nullable = True
+            for Y in reversed(r[1:]):
+                i = index[Y]
+                F[i] |= fo
+                if tail_nullable:
+                    R[i].append(j)
+                if Y in self.nullable:
+                    fo |= fimask[Y]
+                else:
+                    fo = fimask[Y]
+                    tail_nullable = False
+        digraph(R, F)
+
         fotab = {}
-        for s in self.nonterminals|self.terminals:
-            fotab[s] = set()
-        done = False
-        while not done:
-            done = True
-            for key, r in self.rules.iteritems():
-                for i in range(1,len(r)):
-                    fo = set()
-                    for s in r[i+1:]:
-                        fo |= self.fitab[s]
-                        if s not in self.nullable:
-                            break
-                    else:
-                        fo |= fotab[r[0]]
-                    if not (fo <= fotab[r[i]]):
-                        fotab[r[i]] |= fo
-                        done = False
+        decode = _MaskDecoder(terminals)
+        for X,i in index.iteritems():
+            fotab[X] = decode(F[i])
         return fotab
 
     def is_nullable(self, word):
@@ -495,6 +625,11 @@ class Grammar(object):
             fd.write((prefix+"  %s -> %s"%(head, tail)).rstrip()+"\n")
 
     def write_example(self, fd=sys.stdout, params={}):
+        params = params.copy()
+        from time import strftime
+        params.setdefault('date', strftime("%Y-%m-%d %H:%M:%S"))
+        params['version'] = VERSION
+
         word = [ self.rules[-1][1] ]
         todo = set(self.rules.keys())
 
@@ -681,22 +816,20 @@ class NameInventor(object):
         self.idx += 1
         return res
 
-_invent = NameInventor()
-
-def _expand_globbing(head, tail):
+def _expand_globbing(head, tail, invent):
     todo = []
     i = 0
     while i < len(tail):
         x = tail[i]
         if x[0] == 'group':
             assert x[1][0] == '('
-            newhead = ('token', _invent('(')) + x[1][2:]
+            newhead = ('token', invent('(')) + x[1][2:]
             todo.append(('(',newhead)+x[2:])
             assert x[-1][0] == ')'
             tail[i:i+1] = [ newhead ]
         if i+1 < len(tail) and tail[i+1][0] in [ '?', '*', '+' ]:
             op = tail[i+1][0]
-            newhead = ('token', _invent(op)) + tail[i][2:]
+            newhead = ('token', invent(op)) + tail[i][2:]
             todo.append((op,newhead,tail[i],tail[i+1]))
             tail[i:i+2] = [ newhead ]
         i += 1
@@ -708,7 +841,7 @@ def _expand_globbing(head, tail):
         head = item[1]
         tail = item[2:]
         if op == '(':
-            for r in _expand_alternatives(head, tail):
+            for r in _expand_alternatives(head, tail, invent):
                 yield r
         elif op == '?':
             assert len(tail) == 2
@@ -723,7 +856,7 @@ def _expand_globbing(head, tail):
             yield [ head, tail[0], tail[1] ]
             yield [ head, head, tail[0], tail[1] ]
 
-def _expand_alternatives(head, tail):
+def _expand_alternatives(head, tail, invent):
     """Expand the "|" operator.
 
     The value 'tail' must be of the form "list | ... | list ;".
@@ -733,7 +866,7 @@ def _expand_alternatives(head, tail):
             t = _fixup(t)
             rule = list(t[1:])
         else:
-            for r in _expand_globbing(head, rule+[t]):
+            for r in _expand_globbing(head, rule+[t], invent):
                 yield r
 
 def extract_rules(tree):
@@ -742,14 +875,18 @@ def extract_rules(tree):
     This generator yields the grammar rules one by one (without the
     colon after the head but still with the terminating semi-colon).
     The special '?', '*' and '+' suffix tokens are expanded here.
+    The names of the symbols introduced for these are numbered
+    afresh for every call, so that the same tree always gives the
+    same rules.
     """
+    invent = NameInventor()
     res = []
     for rule in tree[1:]:
         rule = _fixup(rule)
         assert rule[0] == 'rule'
         head = rule[1]
         assert rule[2][0] == ':'
-        for r in _expand_alternatives(head, rule[3:]):
+        for r in _expand_alternatives(head, rule[3:], invent):
             res.append(r)
     return res
 
@@ -909,13 +1046,41 @@ def read_grammar(fd, params={}, checkfunc=None):
     file.  If the contents of this file are valid, a `Grammar` object
     is returned.  Otherwise a list of errors is printed to `stderr`
     and the program is terminated.
+
+    If `params["stats"]` is a `Stats` object, the time spent in the
+    different phases of reading the grammar is recorded there.
+
+    If `params["memo"]` is a dictionary, the parse tree of the rules,
+    the `Grammar` object and the scanner are stored there.  Later
+    calls with the same dictionary reuse them for the parts of the
+    grammar file which are unchanged.
     """
     fname = params.get("fname", None)
-    tree, has_errors = _parse_grammar_file(fd, params)
+    stats = params.get("stats") or Stats()
+    memo = params.get("memo")
+
+    # the optional token definitions follow a line "%tokens"
+    lines = list(fd)
+    token_lines = None
+    for k,line in enumerate(lines):
+        if line.strip() == "%tokens":
+            lines, token_lines = lines[:k], lines[k+1:]
+            token_lineno = k+2
+            break
+
+    stats.start("read_grammar")
+    key = tuple(lines)
+    if memo is not None and memo.get("tree", (None,))[0] == key:
+        tree, has_errors = memo["tree"][1], False
+    else:
+        tree, has_errors = _parse_grammar_file(lines, params)
+        if memo is not None and not has_errors:
+            memo["tree"] = (key, tree)
     if tree is None:
         raise SystemExit(1)
 
     rules = extract_rules(tree)
+    stats.stop("read_grammar")
     if not rules:
         _print_error("no rules found", fname=fname)
         raise SystemExit(1)
@@ -925,7 +1090,9 @@ def read_grammar(fd, params={}, checkfunc=None):
                      start[2], start[3], fname=fname)
         raise SystemExit(1)
 
+    stats.start("optimise_rules")
     rules = optimise_rules(rules)
+    stats.stop("optimise_rules")
 
     rule_locations = {}
     overrides = {}
@@ -947,18 +1114,53 @@ def read_grammar(fd, params={}, checkfunc=None):
     params['transparent_tokens'] = frozenset(transparent)
     params['overrides'] = overrides
 
-    try:
-        g = Grammar(rr)
-    except RulesError, e:
-        _print_error(e, fname=fname)
-        raise SystemExit(1)
+    stats.start("grammar")
+    key = tuple(rr)
+    if memo is not None and memo.get("grammar", (None,))[0] == key:
+        g = memo["grammar"][1]
+    else:
+        try:
+            g = Grammar(rr)
+        except RulesError, e:
+            _print_error(e, fname=fname)
+            raise SystemExit(1)
+        if memo is not None:
+            memo["grammar"] = (key, g)
+    stats.stop("grammar")
+    stats.set("rules", len(g.rules))
+    stats.set("terminals", len(g.terminals))
+    stats.set("nonterminals", len(g.nonterminals))
+
+    if token_lines is not None:
+        stats.start("scanner")
+        key = (tuple(token_lines), token_lineno)
+        if memo is not None and memo.get("scanner", (None,))[0] == key:
+            scanner = memo["scanner"][1]
+        else:
+            try:
+                scanner = read_tokens(token_lines, token_lineno)
+            except TokensError, e:
+                _print_error(e, e.lineno, e.offset, fname=fname)
+                raise SystemExit(1)
+            if memo is not None:
+                memo["scanner"] = (key, scanner)
+        for X in scanner.symbols:
+            if X in g.nonterminals:
+                msg = "token '%s' is a nonterminal"%X
+                _print_error(msg, fname=fname)
+                raise SystemExit(1)
+        params['scanner'] = scanner
+        stats.stop("scanner")
+        stats.set("scanner_states", len(scanner.rows))
 
     # check for infinite loops
+    stats.start("shortcuts")
     try:
         g.shortcuts()
     except RulesError, e:
-        _print_error(e)
+        _print_error(e, fname=fname)
         raise SystemExit(1)
+    stats.stop("shortcuts")
 
     if checkfunc is not None:
         try:
@@ -17,6 +17,7 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 import os
+from time import time
 
 def open_executable(fname, mode='r', bufsize=-1):
     """Open a file with the executable bit set.
@@ -36,3 +37,53 @@ def open_executable(fname, mode='r', bufsize=-1):
         flags |= os.O_TRUNC
     fd = os.open(fname, flags, 0777)
     return os.fdopen(fd, mode, bufsize)
+
+class Stats(object):
+
+    """Collect timings and counters while a parser is generated.
+
+    The time spent in each phase of the parser generation is measured
+    by calling `start` and `stop` with the name of the phase; phases
+    may be nested, and the times of phases which run several times
+    are added up.  Counters, e.g. the number of states of the parser
+    automaton, are recorded using `set`.  The collected data can be
+    written in JSON format using `write_json`.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.times = {}
+        self.counters = {}
+        self._started = {}
+
+    def start(self, phase):
+        """Start timing `phase`."""
+        if phase not in self.times:
+            self.phases.append(phase)
+            self.times[phase] = 0.0
+        self._started[phase] = time()
+
+    def stop(self, phase):
+        """Stop timing `phase` and add the elapsed time."""
+        self.times[phase] += time() - self._started.pop(phase)
+
+    def set(self, name, value):
+        """Record the value of counter `name`."""
+        self.counters[name] = value
+
+    def write_json(self, fd, info={}):
+        """Write the collected data to `fd` as a JSON object.
+
+        The object has a member "phases", which lists the phases in
+        the order they were first started, with the time spent in
+        seconds, and a member "counters".  The entries of `info` are
+        added as additional members.
+        """
+        import json
+        data = dict(info)
+        data["phases"] = [ { "name": phase,
+                             "time": round(self.times[phase], 6) }
+                           for phase in self.phases ]
+        data["counters"] = self.counters
+        json.dump(data, fd, indent=2, separators=(",", ": "), sort_keys=True)
+        fd.write("\n")
@@ -0,0 +1,766 @@
+# lexer.py - generate table-driven scanners from token definitions
+#
+# Copyright (C) 2012  Jochen Voss <voss@seehuhn.de>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import sys
+from bisect import bisect_left, bisect_right
+
+from text import split_it
+from scanner import conv
+
+
+# all characters have codes in the range 0, ..., MAXCHAR-1
+MAXCHAR = sys.maxunicode + 1
+
+
+class TokensError(Exception):
+
+    """Errors in the token definitions of a grammar file.
+
+    The attributes `lineno` and `offset` give the location of the
+    error, if known.
+    """
+
+    def __init__(self, msg, lineno=None, offset=None):
+        Exception.__init__(self, msg)
+        self.lineno = lineno
+        self.offset = offset
+
+######################################################################
+# sets of characters
+#
+# Sets of characters are represented as sorted lists of disjoint,
+# non-adjacent intervals (lo, hi), where lo is included and hi is not.
+
+def _normalise(intervals):
+    res = []
+    for lo,hi in sorted(intervals):
+        if lo >= hi:
+            continue
+        if res and lo <= res[-1][1]:
+            if hi > res[-1][1]:
+                res[-1] = (res[-1][0], hi)
+        else:
+            res.append((lo, hi))
+    return res
+
+def _complement(intervals):
+    res = []
+    pos = 0
+    for lo,hi in intervals:
+        if lo > pos:
+            res.append((pos, lo))
+        pos = hi
+    if pos < MAXCHAR:
+        res.append((pos, MAXCHAR))
+    return res
+
+def _fold_case(intervals):
+    """Add the upper- and lower-case variants of all characters."""
+    extra = []
+    for lo,hi in intervals:
+        for c in xrange(lo, min(hi, 0x10000)):
+            u = unichr(c)
+            for v in [ u.lower(), u.upper() ]:
+                if len(v) == 1 and v != u:
+                    k = ord(v)
+                    extra.append((k, k+1))
+    return _normalise(intervals+extra)
+
+def _char(c):
+    k = ord(c)
+    return [ (k, k+1) ]
+
+_digit = [ (ord('0'), ord('9')+1) ]
+_word = _normalise(_digit + [ (ord('A'), ord('Z')+1),
+                              (ord('a'), ord('z')+1), (ord('_'), ord('_')+1) ])
+_space = _normalise([ (ord(c), ord(c)+1) for c in " \t\n\r\f\v" ])
+_class_escapes = {
+    'd': _digit, 'D': _complement(_digit),
+    'w': _word, 'W': _complement(_word),
+    's': _space, 'S': _complement(_space),
+}
+_char_escapes = {
+    'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', 'a': '\a',
+    '0': '\0',
+}
+
+######################################################################
+# regular expressions
+#
+# Parsed regular expressions are represented as nested tuples:
+# ('set', intervals) matches one character from a set, ('cat', list)
+# matches the concatenation and ('alt', list) any of the given
+# expressions, and ('star', x) matches zero or more repetitions of x.
+
+class _RegexParser(object):
+
+    """Convert a regular expression from a string into a tuple tree.
+
+    The syntax is a subset of the syntax of Python's `re` module:
+    characters, escape sequences, character classes `[...]`, `.`,
+    brackets, `|`, and the repetition operators `*`, `+`, `?`,
+    `{m}`, `{m,}` and `{m,n}` are supported.  In addition, `{name}`
+    refers to a previously defined macro.
+    """
+
+    def __init__(self, pattern, macros, ignorecase):
+        self.pattern = pattern
+        self.macros = macros
+        self.ignorecase = ignorecase
+        self.pos = 0
+
+    def error(self, msg, pos=None):
+        if pos is None:
+            pos = self.pos
+        raise TokensError(msg, offset=pos)
+
+    def peek(self):
+        if self.pos < len(self.pattern):
+            return self.pattern[self.pos]
+        return None
+
+    def parse(self):
+        res = self.alternatives()
+        if self.pos < len(self.pattern):
+            self.error("unbalanced ')'")
+        return res
+
+    def alternatives(self):
+        items = [ self.sequence() ]
+        while self.peek() == '|':
+            self.pos += 1
+            items.append(self.sequence())
+        if len(items) == 1:
+            return items[0]
+        return ('alt', items)
+
+    def sequence(self):
+        items = []
+        while self.peek() not in [ None, '|', ')' ]:
+            items.append(self.repetition())
+        if len(items) == 1:
+            return items[0]
+        return ('cat', items)
+
+    def repetition(self):
+        res = self.atom()
+        while True:
+            c = self.peek()
+            if c == '*':
+                self.pos += 1
+                res = ('star', res)
+            elif c == '+':
+                self.pos += 1
+                res = ('cat', [ res, ('star', res) ])
+            elif c == '?':
+                self.pos += 1
+                res = ('alt', [ res, ('cat', []) ])
+            elif c == '{' and self._is_count():
+                m, n = self.count()
+                if n is None:
+                    res = ('cat', [ res ]*m + [ ('star', res) ])
+                else:
+                    opt = ('alt', [ res, ('cat', []) ])
+                    res = ('cat', [ res ]*m + [ opt ]*(n-m))
+            else:
+                break
+        return res
+
+    def _is_count(self):
+        i = self.pos+1
+        return i < len(self.pattern) and self.pattern[i].isdigit()
+
+    def count(self):
+        start = self.pos
+        end = self.pattern.find('}', start)
+        if end < 0:
+            self.error("missing '}'")
+        text = self.pattern[start+1:end]
+        self.pos = end+1
+        try:
+            if ',' in text:
+                m, n = text.split(',', 1)
+                m = int(m)
+                n = int(n) if n.strip() else None
+            else:
+                m = n = int(text)
+        except ValueError:
+            self.error("invalid repetition count", start)
+        if n is not None and n < m:
+            self.error("invalid repetition count", start)
+        return m, n
+
+    def atom(self):
+        c = self.peek()
+        if c == '(':
+            start = self.pos
+            self.pos += 1
+            res = self.alternatives()
+            if self.peek() != ')':
+                self.error("missing ')'", start)
+            self.pos += 1
+            return res
+        elif c == '[':
+            return ('set', self.char_class())
+        elif c == '{':
+            end = self.pattern.find('}', self.pos)
+            name = self.pattern[self.pos+1:end]
+            if end < 0 or name not in self.macros:
+                self.error("unknown macro '%s'"%name)
+            self.pos = end+1
+            return self.macros[name]
+        elif c in [ '*', '+', '?' ]:
+            self.error("nothing to repeat")
+        elif c in [ '^', '$' ]:
+            self.error("anchors are not supported")
+        elif c == '.':
+            self.pos += 1
+            return ('set', _complement(_char('\n')))
+        elif c == '\\':
+            return ('set', self.case(self.escape()))
+        else:
+            self.pos += 1
+            return ('set', self.case(_char(c)))
+
+    def case(self, intervals):
+        if self.ignorecase:
+            return _fold_case(intervals)
+        return intervals
+
+    def escape(self):
+        """Parse an escape sequence and return the set of characters."""
+        start = self.pos
+        self.pos += 1
+        c = self.peek()
+        if c is None:
+            self.error("incomplete escape sequence", start)
+        self.pos += 1
+        if c in _class_escapes:
+            return _class_escapes[c]
+        if c in _char_escapes:
+            return _char(_char_escapes[c])
+        if c in "xu":
+            l = 2 if c == "x" else 4
+            digits = self.pattern[self.pos:self.pos+l]
+            try:
+                k = int(digits, 16)
+            except ValueError:
+                k = None
+            if len(digits) < l or k is None:
+                self.error("invalid escape sequence", start)
+            self.pos += l
+            return [ (k, k+1) ]
+        return _char(c)
+
+    def char_class(self):
+        start = self.pos
+        self.pos += 1
+        negate = False
+        if self.peek() == '^':
+            negate = True
+            self.pos += 1
+        intervals = []
+        first = True
+        while True:
+            c = self.peek()
+            if c is None:
+                self.error("missing ']'", start)
+            if c == ']' and not first:
+                self.pos += 1
+                break
+            first = False
+            lo = self.class_char()
+            if len(lo) != 1 or lo[0][1]-lo[0][0] != 1:
+                # a class escape like \d
+                intervals.extend(lo)
+                continue
+            if (self.peek() == '-' and self.pos+1 < len(self.pattern)
+                and self.pattern[self.pos+1] != ']'):
+                self.pos += 1
+                hi = self.class_char()
+                if len(hi) != 1 or hi[0][1]-hi[0][0] != 1:
+                    self.error("invalid character range", start)
+                if hi[0][0] < lo[0][0]:
+                    self.error("invalid character range", start)
+                intervals.append((lo[0][0], hi[0][1]))
+            else:
+                intervals.extend(lo)
+        intervals = self.case(_normalise(intervals))
+        if negate:
+            intervals = _complement(intervals)
+        return intervals
+
+    def class_char(self):
+        c = self.peek()
+        if c == '\\':
+            return self.escape()
+        self.pos += 1
+        return _char(c)
+
+######################################################################
+# the scanner automaton
+
+class _NFA(object):
+
+    """A non-deterministic finite automaton with epsilon moves."""
+
+    def __init__(self):
+        self.eps = []
+        self.trans = []
+        self.sets = []
+        self.set_idx = {}
+
+    def new_state(self):
+        self.eps.append([])
+        self.trans.append([])
+        return len(self.eps)-1
+
+    def add(self, expr):
+        """Add states for the expression `expr`.
+
+        The return value is a pair `(start, end)` of states.
+        """
+        tp = expr[0]
+        if tp == 'set':
+            key = tuple(expr[1])
+            k = self.set_idx.get(key)
+            if k is None:
+                k = self.set_idx[key] = len(self.sets)
+                self.sets.append(expr[1])
+            start = self.new_state()
+            end = self.new_state()
+            self.trans[start].append((k, end))
+        elif tp == 'cat':
+            start = end = self.new_state()
+            for x in expr[1]:
+                s, e = self.add(x)
+                self.eps[end].append(s)
+                end = e
+        elif tp == 'alt':
+            start = self.new_state()
+            end = self.new_state()
+            for x in expr[1]:
+                s, e = self.add(x)
+                self.eps[start].append(s)
+                self.eps[e].append(end)
+        else:
+            start = self.new_state()
+            end = self.new_state()
+            s, e = self.add(expr[1])
+            self.eps[start].extend([s, end])
+            self.eps[e].extend([s, end])
+        return start, end
+
+    def closure(self, states):
+        res = set(states)
+        todo = list(states)
+        while todo:
+            s = todo.pop()
+            for t in self.eps[s]:
+                if t not in res:
+                    res.add(t)
+                    todo.append(t)
+        return frozenset(res)
+
+
+class Scanner(object):
+
+    """A minimal deterministic automaton to split text into tokens.
+
+    The input characters are grouped into classes of characters
+    which are treated the same by all token definitions, and the
+    automaton has one transition per state and class.  At every
+    position of the input, the scanner finds the longest prefix which
+    matches one of the definitions; if several definitions match, the
+    first one wins.
+    """
+
+    def __init__(self, definitions):
+        """Construct the scanner for a list of token definitions.
+
+        `definitions` is a list of pairs `(symbol, expr)` in order of
+        priority, where `expr` is a parsed regular expression and
+        `symbol` is the terminal symbol to emit or None, if the
+        matched text is to be skipped.
+        """
+        self.symbols = [ X for X,expr in definitions ]
+
+        nfa = _NFA()
+        start = nfa.new_state()
+        final = {}
+        for k,(X,expr) in enumerate(definitions):
+            s, e = nfa.add(expr)
+            nfa.eps[start].append(s)
+            final[e] = k
+
+        self._make_classes(nfa.sets)
+        set_classes = self._set_classes
+
+        # subset construction
+        start = nfa.closure([start])
+        dstates = { start: 0 }
+        order = [ start ]
+        closures = {}
+        rows = []
+        accept = []
+        k = 0
+        while k < len(order):
+            D = order[k]
+            k += 1
+            moves = {}
+            for s in D:
+                for setid,t in nfa.trans[s]:
+                    for c in set_classes[setid]:
+                        moves.setdefault(c, set()).add(t)
+            row = [ -1 ] * self.nclasses
+            for c,targets in moves.iteritems():
+                targets = frozenset(targets)
+                T = closures.get(targets)
+                if T is None:
+                    T = closures[targets] = nfa.closure(targets)
+                j = dstates.get(T)
+                if j is None:
+                    j = dstates[T] = len(order)
+                    order.append(T)
+                row[c] = j
+            rows.append(row)
+            matches = [ final[s] for s in D if s in final ]
+            accept.append(min(matches) if matches else -1)
+
+        self._minimise(rows, accept)
+        self._merge_classes()
+
+    def _make_classes(self, sets):
+        """Partition the characters into classes.
+
+        Two characters are in the same class, if they are contained
+        in exactly the same sets.  The result is stored in
+        `self._bounds` (the start of every range of characters) and
+        `self._range_class` (the class for each range), and
+        `self._set_classes[k]` lists the classes which make up set
+        number k.
+        """
+        points = set([ 0, MAXCHAR ])
+        for intervals in sets:
+            for lo,hi in intervals:
+                points.add(lo)
+                points.add(hi)
+        points = sorted(points)
+
+        members = [ [] for k in range(0, len(points)-1) ]
+        for k,intervals in enumerate(sets):
+            for lo,hi in intervals:
+                for i in range(bisect_left(points, lo),
+                               bisect_left(points, hi)):
+                    members[i].append(k)
+
+        class_idx = {}
+        range_class = []
+        set_classes = [ set() for intervals in sets ]
+        for i,m in enumerate(members):
+            m = tuple(m)
+            c = class_idx.get(m)
+            if c is None:
+                c = class_idx[m] = len(class_idx)
+            range_class.append(c)
+            for k in m:
+                set_classes[k].add(c)
+
+        self.nclasses = len(class_idx)
+        self._bounds = points[:-1]
+        self._range_class = range_class
+        self._set_classes = [ sorted(cc) for cc in set_classes ]
+
+    def _minimise(self, rows, accept):
+        """Merge equivalent states, using Moore's algorithm."""
+        idx = {}
+        block = [ idx.setdefault(a, len(idx)) for a in accept ]
+        n = len(idx)
+        while True:
+            idx = {}
+            new_block = []
+            for k,row in enumerate(rows):
+                sig = (block[k],) + tuple(block[j] if j >= 0 else -1
+                                          for j in row)
+                new_block.append(idx.setdefault(sig, len(idx)))
+            block = new_block
+            if len(idx) == n:
+                break
+            n = len(idx)
+
+        # renumber the blocks in order of first occurrence, so that
+        # the initial state stays number 0
+        label = {}
+        for b in block:
+            label.setdefault(b, len(label))
+        self.rows = [ None ] * len(label)
+        self.accept = [ None ] * len(label)
+        for k,row in enumerate(rows):
+            b = label[block[k]]
+            if self.rows[b] is None:
+                self.rows[b] = [ label[block[j]] if j >= 0 else -1
+                                 for j in row ]
+                self.accept[b] = accept[k]
+
+    def _merge_classes(self):
+        """Merge character classes which have identical transitions."""
+        columns = zip(*self.rows)
+        idx = {}
+        new_class = [ idx.setdefault(col, len(idx)) for col in columns ]
+        self.nclasses = len(idx)
+        keep = sorted(idx.itervalues())
+        first = {}
+        for c,nc in enumerate(new_class):
+            first.setdefault(nc, c)
+        self.rows = [ [ row[first[nc]] for nc in keep ] for row in self.rows ]
+        self._range_class = [ new_class[c] for c in self._range_class ]
+
+    def char_class(self, c):
+        """Return the class of the character with code `c`."""
+        return self._range_class[bisect_right(self._bounds, c)-1]
+
+    def scan(self, text):
+        """Split `text` into tokens.
+
+        This implements the same algorithm as the `scan` method of the
+        generated parsers; it is used for testing.
+        """
+        pos = 0
+        line = 1
+        bol = 0
+        while pos < len(text):
+            state = 0
+            best = -1
+            end = pos+1
+            i = pos
+            while i < len(text):
+                state = self.rows[state][self.char_class(ord(text[i]))]
+                if state < 0:
+                    break
+                i += 1
+                if self.accept[state] >= 0:
+                    best = self.accept[state]
+                    end = i
+            value = text[pos:end]
+            if best >= 0:
+                X = self.symbols[best]
+            else:
+                X = value
+            if X is not None:
+                yield (X, value, line, pos-bol+1)
+            k = value.rfind('\n')
+            if k >= 0:
+                line += value.count('\n')
+                bol = pos+k+1
+            pos = end
+
+    def write_tables(self, fd):
+        """Emit the scanner tables as part of the generated parser."""
+        tt = [ repr(X) for X in self.symbols ]
+        for l in split_it(tt, padding="    ", start1="_scan_tokens = ( ",
+                          end2=(",)" if len(tt) == 1 else " )")):
+            fd.write(l+'\n')
+
+        tt = [ str(self.char_class(c)) for c in range(0, 128) ]
+        for l in split_it(tt, padding="    ", start1="_scan_ascii = ( ",
+                          end2=" )"):
+            fd.write(l+'\n')
+        fd.write("    _scan_cmap = dict((chr(k),c)"
+                 " for k,c in enumerate(_scan_ascii))\n")
+
+        # ranges of non-ASCII characters
+        bounds = []
+        classes = []
+        for lo,c in zip(self._bounds, self._range_class):
+            if lo < 128:
+                lo = 128
+                if bounds:
+                    bounds.pop()
+                    classes.pop()
+            if not classes or classes[-1] != c:
+                bounds.append(lo)
+                classes.append(c)
+        end = ",)" if len(bounds) == 1 else " )"
+        for l in split_it(map(str, bounds), padding="    ",
+                          start1="_scan_bounds = ( ", end2=end):
+            fd.write(l+'\n')
+        for l in split_it(map(str, classes), padding="    ",
+                          start1="_scan_high = ( ", end2=end):
+            fd.write(l+'\n')
+
+        fd.write("    _scan_next = (\n")
+        for row in self.rows:
+            end = ",)," if len(row) == 1 else " ),"
+            for l in split_it(map(str, row), padding="        ",
+                              start1="( ", end2=end):
+                fd.write(l+'\n')
+        fd.write("    )\n")
+        for l in split_it(map(str, self.accept), padding="    ",
+                          start1="_scan_accept = ( ",
+                          end2=(",)" if len(self.accept) == 1 else " )")):
+            fd.write(l+'\n')
+
+######################################################################
+# read token definitions
+
+def _read_quoted(line, pos):
+    """Read a quoted string starting at `line[pos]`.
+
+    Returns the string and the position after the closing quote.
+    """
+    sep = line[pos]
+    res = []
+    i = pos+1
+    while i < len(line):
+        c = line[i]
+        if c == '\\' and i+1 < len(line):
+            res.append(line[i+1])
+            i += 2
+        elif c == sep:
+            return "".join(res), i+1
+        else:
+            res.append(c)
+            i += 1
+    raise TokensError("unterminated string", offset=pos)
+
+def _read_word(line, pos):
+    i = pos
+    while i < len(line) and (line[i].isalnum() or line[i] in "-_"):
+        i += 1
+    return line[pos:i], i
+
+def _skip_space(line, pos):
+    while pos < len(line) and line[pos].isspace():
+        pos += 1
+    return pos
+
+def read_tokens(lines, lineno=1):
+    """Read the token definitions from the `%tokens` section.
+
+    `lines` iterates over the lines of the section, the first of
+    which has number `lineno` in the grammar file.  Every line is
+    either empty, a comment starting with "#", or one of the
+    following:
+
+    * `NAME PATTERN`: the terminal symbol NAME matches the regular
+      expression PATTERN.  NAME can be given in quotes.
+    * `"A" "B" ...`: each of the quoted terminal symbols matches its
+      own name, literally.
+    * `%define NAME PATTERN`: the macro `{NAME}` can be used in
+      later patterns to stand for PATTERN.
+    * `%ignore PATTERN`: text matching PATTERN is skipped.
+    * `%ignorecase`: the following patterns ignore the case of
+      letters.
+
+    The return value is a `Scanner` object.  Errors are reported by
+    raising `TokensError`.
+    """
+    macros = {}
+    ignorecase = False
+    definitions = []
+    for line in lines:
+        try:
+            pos = _skip_space(line, 0)
+            if pos == len(line) or line[pos] == '#':
+                pass
+            elif line[pos] == '%':
+                word, pos = _read_word(line, pos+1)
+                pos = _skip_space(line, pos)
+                if word == "ignorecase":
+                    ignorecase = True
+                    continue
+                if word == "define":
+                    name, pos = _read_word(line, pos)
+                    if not name:
+                        raise TokensError("missing macro name", offset=pos)
+                    pos = _skip_space(line, pos)
+                elif word != "ignore":
+                    msg = "unknown directive '%%%s'"%word
+                    raise TokensError(msg, offset=0)
+                pattern = line[pos:].rstrip()
+                if not pattern:
+                    raise TokensError("missing pattern", offset=pos)
+                expr = _parse(pattern, pos, macros, ignorecase,
+                              word != "define")
+                if word == "define":
+                    macros[name] = expr
+                else:
+                    definitions.append((None, expr))
+            else:
+                names = []
+                while pos < len(line) and line[pos] in "'\"":
+                    name, pos = _read_quoted(line, pos)
+                    names.append(name)
+                    pos = _skip_space(line, pos)
+                quoted = bool(names)
+                if not quoted:
+                    name, pos = _read_word(line, pos)
+                    if not name:
+                        raise TokensError("invalid token name", offset=pos)
+                    pos = _skip_space(line, pos)
+                    names = [ name ]
+                pattern = line[pos:].rstrip()
+                if pattern:
+                    if len(names) > 1:
+                        msg = "only one token name allowed before pattern"
+                        raise TokensError(msg, offset=pos)
+                    expr = _parse(pattern, pos, macros, ignorecase)
+                    definitions.append((conv(names[0]), expr))
+                elif not quoted:
+                    raise TokensError("missing pattern", offset=pos)
+                else:
+                    for name in names:
+                        if not name:
+                            raise TokensError("empty token", offset=pos)
+                        expr = ('cat', [ ('set', _fold_case(_char(c))
+                                          if ignorecase else _char(c))
+                                         for c in name ])
+                        definitions.append((conv(name), expr))
+        except TokensError, e:
+            if e.offset is not None:
+                e.offset += 1
+            e.lineno = lineno
+            raise
+        lineno += 1
+
+    if not definitions:
+        raise TokensError("no tokens defined", lineno=lineno)
+    return Scanner(definitions)
+
+def _nullable(expr):
+    """Check whether `expr` matches the empty string."""
+    tp = expr[0]
+    if tp == 'set':
+        return False
+    elif tp == 'cat':
+        return all(_nullable(x) for x in expr[1])
+    elif tp == 'alt':
+        return any(_nullable(x) for x in expr[1])
+    else:
+        return True
+
+def _parse(pattern, pos, macros, ignorecase, check_empty=True):
+    """Parse a pattern which starts at position `pos` in its line."""
+    try:
+        expr = _RegexParser(pattern, macros, ignorecase).parse()
+    except TokensError, e:
+        e.offset += pos
+        raise
+    if check_empty and _nullable(expr):
+        raise TokensError("pattern matches the empty string", offset=pos)
+    return expr
@@ -16,6 +16,9 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+import re
+
+
 def isascii(s):
     return all(ord(c)<128 for c in s)
 
@@ -25,6 +28,22 @@ def conv(s):
     else:
         return s
 
+# Every match of `_token_re` is one token, preceeded by white space and
+# comments.  The comments include the final newline and the last
+# alternative excludes white space and "#", so that no match can start
+# in the middle of skipped text.  A quote character which does not
+# start a complete string is matched by the last alternative.
+_token_pattern = r"""
+    (?: \s | \#[^\n]*\n )*
+    (?: (\w[\w-]*)
+      | "((?:[^"\\]|\\.)*)"
+      | '((?:[^'\\]|\\.)*)'
+      | ([^\s\#]) )
+"""
+_token_re = re.compile(_token_pattern, re.VERBOSE|re.DOTALL)
+_utoken_re = re.compile(_token_pattern, re.VERBOSE|re.DOTALL|re.UNICODE)
+_escape_re = re.compile(r"\\(.)", re.DOTALL)
+
 def tokens(source):
     """Generator to read input and break it into tokens.
 
@@ -39,63 +58,63 @@ def tokens(source):
     If the input ends in an unterminated string or comment, a
     SyntaxError exception is raised.
     """
-    s = None
-    state = None
-    line = 1
+    lines = []
+    starts = []
+    pos = 0
     for l in source:
         l = l.expandtabs()
         if not l.endswith("\n"):
             l = l + '\n'
-        for col, c in enumerate(l):
-            if state == "skip":
-                state = None
-            elif state == "word":
-                if c.isalnum() or c in "-_":
-                    s += c
-                else:
-                    yield ("token", conv(s), line0, col0)
-                    state = None
-            elif state == "string":
-                if c == '\\':
-                    state = "quote"
-                elif c == sep:
-                    yield ("string", conv(s), line0, col0)
-                    state = "skip"
-                else:
-                    s += c
-            elif state == "quote":
-                s += c
-                state = "string"
-            elif state == "comment" and c == '\n':
-                state = "skip"
+        lines.append(l)
+        starts.append(pos)
+        pos += len(l)
+    if not lines:
+        return
+    text = "".join(lines)
+    starts.append(pos+1)
 
-            if state is None:
-                line0 = line
-                col0 = col+1
-                if c == "'":
-                    state = "string"
-                    sep = "'"
-                    s = ""
-                elif c == '"':
-                    state = "string"
-                    sep = '"'
-                    s = ""
-                elif c.isalnum() or c == "_":
-                    state = "word"
-                    s = c
-                elif c == "#":
-                    state = "comment"
-                elif c.isspace():
-                    state = "skip"
-                else:
-                    yield (conv(c), conv(c), line0, col0)
-                    state = "skip"
-        line += 1
+    # for ASCII input, all values are converted to `str` at once
+    is_str = True
+    if isinstance(text, unicode):
+        token_re = _utoken_re
+        try:
+            text = text.encode("ascii")
+        except UnicodeError:
+            is_str = False
+    else:
+        token_re = _token_re
 
-    if state == "word":
-        yield ("token", conv(s), line0, col0)
-    elif state not in [ None, "skip", "comment" ]:
-        if l[-1] == '\n':
-            l = l[:-1]
-        msg = "unterminated string"
-        raise SyntaxError(msg, (source.name, line0, col0, l[-20:]))
+    match = token_re.match
+    pos = 0
+    line = 0
+    next_start = starts[1]
+    while True:
+        m = match(text, pos)
+        if m is None:
+            break
+        pos = m.end()
+        k = m.lastindex
+        start = m.start(k)
+        if k == 2 or k == 3:
+            # include the opening quote
+            start -= 1
+        while start >= next_start:
+            line += 1
+            next_start = starts[line+1]
+        col = start-starts[line]+1
+        s = m.group(k)
+        if k == 1:
+            yield ("token", s if is_str else conv(s), line+1, col)
+        elif k < 4:
+            if '\\' in s:
+                s = _escape_re.sub(r"\1", s)
+            yield ("string", s if is_str else conv(s), line+1, col)
+        elif s in "\"'":
+            l = lines[-1][:-1]
+            msg = "unterminated string"
+            fname = getattr(source, "name", None)
+            raise SyntaxError(msg, (fname, line+1, col, l[-20:]))
+        else:
+            if not is_str:
+                s = conv(s)
+            yield (s, s, line+1, col)
@@ -30,13 +30,200 @@
 
 def print_tree(tree, terminals, indent=0):
     """Print a parse tree to stdout."""
-    prefix = "    "*indent
-    if tree[0] in terminals:
-        print prefix + repr(tree)
-    else:
-        print prefix + unicode(tree[0])
-        for x in tree[1:]:
-            print_tree(x, terminals, indent+1)
+    terminals = frozenset(terminals)
+    stack = [ (tree, indent) ]
+    while stack:
+        tree, indent = stack.pop()
+        prefix = "    "*indent
+        if tree[0] in terminals:
+            print prefix + repr(tree)
+        else:
+            print prefix + unicode(tree[0])
+            stack.extend((x, indent+1) for x in tree[:0:-1])
+
+def _parse_many_init(cls, kwargs):
+    """Create the parser used by a worker process of `parse_many`."""
+    global _worker_parser
+    _worker_parser = cls(**kwargs)
+
+def _parse_many_worker(tokens):
+    """Parse one input in a worker process of `parse_many`.
+
+    The end-of-input marker does not survive the transfer to the
+    parent process, so it is replaced by None in error reports.
+    """
+    p = _worker_parser
+    try:
+        return (True, p.parse(tokens))
+    except p.ParseErrors, e:
+        EOF = p.EOF
+        errors = []
+        for err in e.errors:
+            token = err[0]
+            if token[0] is EOF:
+                token = (None,)+token[1:]
+            expect = [ None if X is EOF else X for X in err[1] ]
+            errors.append((token, expect)+tuple(err[2:]))
+        return (False, (errors, e.tree))
+
+class Arena(object):
+
+    """A parse tree stored in flat arrays.
+
+    Every inner node of the tree is identified by a number `node`.
+    `symbols[symbol[node]]` is the nonterminal symbol of the node and
+    its children are listed in `children[first[node]:first[node]+
+    count[node]]`.  Children are given as references: non-negative
+    references are node numbers, a negative reference `r` stands for
+    the leaf `tokens[-r-1]`, i.e. for an input token.  Children are
+    always created before their parent, and the root of the tree is
+    `root`.
+
+    After a parse error was repaired, the arrays may contain nodes
+    which are not part of the tree.
+    """
+
+    def __init__(self):
+        from array import array
+        self.symbols = []
+        self._symbol_id = {}
+        self.symbol = array('i')
+        self.first = array('i')
+        self.count = array('i')
+        self.children = array('i')
+        self.tokens = []
+        self.root = None
+
+    def _add(self, X, refs):
+        """Add a node for symbol `X` with the given children."""
+        i = self._symbol_id.get(X)
+        if i is None:
+            i = self._symbol_id[X] = len(self.symbols)
+            self.symbols.append(X)
+        node = len(self.symbol)
+        self.symbol.append(i)
+        self.first.append(len(self.children))
+        self.count.append(len(refs))
+        self.children.extend(refs)
+        return node
+
+    def cursor(self, ref=None):
+        """Return a `Cursor` pointing to `ref` (default: the root)."""
+        return Cursor(self, ref)
+
+    def leaves(self, ref=None):
+        """Iterate over the tokens below `ref` (default: the root)."""
+        if ref is None:
+            ref = self.root
+        first = self.first
+        count = self.count
+        children = self.children
+        tokens = self.tokens
+        stack = [ ref ]
+        while stack:
+            r = stack.pop()
+            if r < 0:
+                yield tokens[-r-1]
+            else:
+                f = first[r]
+                stack.extend(reversed(children[f:f+count[r]]))
+
+    def to_tuples(self, ref=None):
+        """Convert the tree below `ref` into nested tuples.
+
+        The result is the same parse tree which the parser returns
+        when no arena is used.
+        """
+        if ref is None:
+            ref = self.root
+        symbols = self.symbols
+        symbol = self.symbol
+        first = self.first
+        count = self.count
+        children = self.children
+        tokens = self.tokens
+        # references `r >= n` mark nodes `r-n` whose children are done
+        n = len(symbol)
+        values = []
+        stack = [ ref ]
+        while stack:
+            r = stack.pop()
+            if r < 0:
+                values.append(tokens[-r-1])
+            elif r >= n:
+                r -= n
+                c = count[r]
+                if c:
+                    tree = (symbols[symbol[r]],) + tuple(values[-c:])
+                    del values[-c:]
+                else:
+                    tree = (symbols[symbol[r]],)
+                values.append(tree)
+            else:
+                stack.append(r+n)
+                f = first[r]
+                stack.extend(reversed(children[f:f+count[r]]))
+        return values[0]
+
+class Cursor(object):
+
+    """A position in an `Arena` tree.
+
+    The cursor can be moved through the tree using the `goto_*`
+    methods, which return False if the requested node does not exist
+    (in which case the cursor does not move).
+    """
+
+    def __init__(self, tree, ref=None):
+        self.tree = tree
+        self.ref = tree.root if ref is None else ref
+        # (parent, index of the current node) for all ancestors
+        self._path = []
+
+    @property
+    def is_leaf(self):
+        """True if the cursor points to an input token."""
+        return self.ref < 0
+
+    @property
+    def symbol(self):
+        """The grammar symbol of the current node."""
+        tree = self.tree
+        if self.ref < 0:
+            return tree.tokens[-self.ref-1][0]
+        return tree.symbols[tree.symbol[self.ref]]
+
+    @property
+    def token(self):
+        """The input token for leaves, None for inner nodes."""
+        if self.ref < 0:
+            return self.tree.tokens[-self.ref-1]
+        return None
+
+    def goto_first_child(self):
+        tree = self.tree
+        if self.ref < 0 or tree.count[self.ref] == 0:
+            return False
+        self._path.append((self.ref, 0))
+        self.ref = tree.children[tree.first[self.ref]]
+        return True
+
+    def goto_next_sibling(self):
+        if not self._path:
+            return False
+        tree = self.tree
+        parent, i = self._path[-1]
+        if i+1 >= tree.count[parent]:
+            return False
+        self._path[-1] = (parent, i+1)
+        self.ref = tree.children[tree.first[parent]+i+1]
+        return True
+
+    def goto_parent(self):
+        if not self._path:
+            return False
+        self.ref = self._path.pop()[0]
+        return True
 
 class Parser(object):
 
@@ -73,7 +260,15 @@ class Parser(object):
             self.errors = errors
             self.tree = tree
 
-    def __init__(self, max_err=None, errcorr_pre=4, errcorr_post=4):
+    class _Children(list):
+
+        """Children of a transparent symbol in semantic action mode.
+
+        Instances of this class are spliced into the parent node.
+        """
+
+    def __init__(self, max_err=None, errcorr_pre=4, errcorr_post=4,
+                 errcorr_budget=None, actions=None, arena=False):
         """Create a new parser instance.
 
         The constructor arguments are all optional, they control the
@@ -83,11 +278,118 @@ class Parser(object):
         the parser considers when trying to repair the input.
         `errcorr_post` controls how far beyond an invalid token the
         parser reads when evaluating the quality of an attempted
-        repair.
+        repair.  `errcorr_budget` can be given to bound the number of
+        attempted repairs for each error; the best repair found
+        within this budget is used.
+
+        #@ IF parser_actions
+        If `actions` is given, it must be a dictionary which maps
+        nonterminal symbols to functions.  Whenever a production rule
+        for one of these symbols is applied, the function is called
+        with the values of the children as arguments, and the return
+        value replaces the sub-tree.  In this mode, `errcorr_pre` is
+        ignored since the input cannot be reconstructed from the
+        semantic values.
+        #@ ELSE
+        `actions` is only supported by parsers generated with the
+        --actions option of Wisent.
+        #@ ENDIF
+
+        #@ IF parser_arena
+        If `arena` is true, parse trees are returned as `Arena`
+        objects, which store all nodes in a few flat arrays instead
+        of nested tuples.  This cannot be combined with `actions`.
+        #@ ELSE
+        `arena` is only supported by parsers generated with the
+        --arena option of Wisent.
+        #@ ENDIF
         """
+        #@ IF parser_arena
+        if arena and actions is not None:
+            raise ValueError("arena and actions cannot be combined")
+        #@ ELSE
+        if arena:
+            raise ValueError("parser generated without arena support")
+        #@ ENDIF
         self.max_err = max_err
         self.m = errcorr_pre
         self.n = errcorr_post
+        self.budget = errcorr_budget
+        #@ IF parser_actions
+        self._actions = actions
+        #@ ELSE
+        if actions is not None:
+            raise ValueError("parser generated without support for actions")
+        self._actions = None
+        #@ ENDIF
+        self._use_arena = arena
+        self._arena = None
+        self._push = None
+        #@ IF parser_stats
+        self.reset_stats()
+        #@ ENDIF
+
+    @classmethod
+    def load_tables(cls, fname=None):
+        """Load the parser tables from the binary tables file.
+
+        This is done automatically before the first input is parsed.
+        `fname` defaults to the file name given when the parser was
+        generated, relative to the directory containing this module.
+        The file is memory-mapped and the tables are stored in
+        compact arrays, which are shared by all instances of the
+        class.  Programs which fork worker processes should call this
+        method before forking, so that all workers share one copy of
+        the tables.
+        """
+        from array import array
+        from mmap import mmap, ACCESS_READ
+        from os.path import abspath, dirname, join
+        from struct import unpack_from
+        from sys import byteorder
+
+        if fname is None:
+            fname = join(dirname(abspath(__file__)), cls._tables_file)
+        fd = open(fname, "rb")
+        try:
+            data = mmap(fd.fileno(), 0, access=ACCESS_READ)
+        finally:
+            fd.close()
+        try:
+            magic,version,signature,n = unpack_from("<8siIi", data)
+            if (magic != "WISENT\0\0" or version != 1
+                or signature != cls._tables_signature):
+                raise ValueError("%s: invalid parser tables"%fname)
+            lengths = unpack_from("<%di"%n, data, 20)
+            pos = 20 + 4*n
+            tables = []
+            for l in lengths:
+                vec = array('i', data[pos:pos+4*l])
+                if byteorder != "little":
+                    vec.byteswap()
+                tables.append(vec)
+                pos += 4*l
+        finally:
+            data.close()
+        (cls._base, cls._check, cls._next, cls._default,
+         cls._gbase, cls._gcheck, cls._gnext, cls._gdefault) = tables
+
+    def expected(self, state=None):
+        """Return the terminal symbols which are valid in a state.
+
+        `state` is a state of the parser automaton, as found on the
+        parser stack.  If it is omitted, the current state of
+        incremental parsing (see `feed`) is used.  The return value
+        is a tuple of all terminal symbols, including `EOF`, for
+        which the automaton has a shift or reduce action in this
+        state.
+        """
+        if state is None:
+            if self._push is None:
+                state = 0
+            else:
+                state = self._push[1]
+        return self._expected_sets[self._expected[state]]
 
     @staticmethod
     def leaves(tree):
@@ -96,12 +398,103 @@ class Parser(object):
         This function can be used to reconstruct the input from a
         parse tree.
         """
-        if tree[0] in Parser.terminals:
+        terminals = Parser._terminal_set
+        stack = [ tree ]
+        while stack:
+            tree = stack.pop()
+            if tree[0] in terminals:
+                yield tree
+            else:
+                stack.extend(tree[:0:-1])
+
+    @staticmethod
+    def preorder(tree):
+        """Iterate over all nodes of a parse tree in pre-order.
+
+        Every sub-tree is listed before its children.
+        """
+        terminals = Parser._terminal_set
+        stack = [ tree ]
+        while stack:
+            tree = stack.pop()
             yield tree
-        else:
-            for x in tree[1:]:
-                for t in Parser.leaves(x):
-                    yield t
+            if tree[0] not in terminals:
+                stack.extend(tree[:0:-1])
+
+    @staticmethod
+    def postorder(tree):
+        """Iterate over all nodes of a parse tree in post-order.
+
+        Every sub-tree is listed after its children.
+        """
+        terminals = Parser._terminal_set
+        stack = [ tree ]
+        # inner nodes wait here until their children are done; a
+        # None entry on the stack marks the end of the children
+        pending = []
+        while stack:
+            tree = stack.pop()
+            if tree is None:
+                yield pending.pop()
+            elif tree[0] in terminals:
+                yield tree
+            else:
+                pending.append(tree)
+                stack.append(None)
+                stack.extend(tree[:0:-1])
+
+    def scan(self, text):
+        """Split a string into tokens.
+
+        The tokens are found using the definitions from the `%tokens`
+        section of the grammar file.  At every position, the longest
+        matching token is used; if several definitions match, the
+        first one wins.  Text matched by `%ignore` is skipped.
+
+        The return value is an iterator over tuples `(X, s, line,
+        col)`, suitable as input for `parse`.  Here `X` is the
+        terminal symbol, `s` the matched text and `line` and `col`
+        give the position of the token (starting with 1).  Characters
+        which are not matched by any definition are returned as
+        single-character tokens, with the character as the symbol.
+        """
+        from bisect import bisect_right
+        cmap = self._scan_cmap
+        next = self._scan_next
+        accept = self._scan_accept
+        symbols = self._scan_tokens
+        n = len(text)
+        pos = 0
+        line = 1
+        bol = 0
+        while pos < n:
+            state = 0
+            best = -1
+            end = pos+1
+            i = pos
+            while i < n:
+                c = text[i]
+                cls = cmap.get(c)
+                if cls is None:
+                    k = bisect_right(self._scan_bounds, ord(c))-1
+                    cls = cmap[c] = self._scan_high[k]
+                state = next[state][cls]
+                if state < 0:
+                    break
+                i += 1
+                if accept[state] >= 0:
+                    best = accept[state]
+                    end = i
+            s = text[pos:end]
+            if best < 0:
+                yield (s, s, line, pos-bol+1)
+            elif symbols[best] is not None:
+                yield (symbols[best], s, line, pos-bol+1)
+            k = s.rfind('\n')
+            if k >= 0:
+                line += s.count('\n')
+                bol = pos+k+1
+            pos = end
 
     def _parse(self, tokens, stack, state):
         """Internal function to construct a parse tree.
@@ -114,6 +507,19 @@ class Parser(object):
         number of successfully shifted tokens, and 'error' is None on
         success or else the first token which could not be parsed.
         """
+        apply = None
+        #@ IF parser_actions
+        if self._actions is not None:
+            apply = self._apply_action
+        #@ ENDIF
+        #@ IF parser_arena
+        if self._arena is not None:
+            apply = self._arena_reduce
+        #@ ENDIF
+        #@ IF parser_stats
+        reductions = self.stats["reductions"]
+        depth = self.stats["max_depth"]
+        #@ ENDIF
         read_next = True
         count = 0
         while state != self._halting_state:
@@ -121,8 +527,16 @@ class Parser(object):
                 try:
                     lookahead = tokens.next()
                 except StopIteration:
+                    #@ IF parser_stats
+                    self._record_stats(count, depth)
+                    #@ ENDIF
                     return (False,count,state,None)
                 read_next = False
+                #@ IF integer_tables
+                # unknown symbols map to the last column, which only
+                # contains error entries
+                column = self._token_id.get(lookahead[0], -1)
+                #@ ENDIF
             token = lookahead[0]
             #@ IF parser_debugprint
 
@@ -133,6 +547,29 @@ class Parser(object):
             print " ".join(debug)+" [%s]"%repr(token)
             #@ ENDIF parser_debugprint
 
+            #@ IF integer_tables
+            #@ IF packed_tables
+            i = self._base[state] + column
+            if self._check[i] == state:
+                action = self._next[i]
+            else:
+                action = self._default[state]
+            #@ ELSE
+            action = self._action[state][column]
+            #@ ENDIF
+            if action > 0:
+                #@ IF parser_debugprint
+                print "shift %s"%repr(token)
+                #@ ENDIF
+                stack.append((state,lookahead))
+                state = action
+                read_next = True
+                count += 1
+                #@ IF parser_stats
+                if len(stack) > depth:
+                    depth = len(stack)
+                #@ ENDIF
+            #@ ELSE
             if (state,token) in self._shift:
                 #@ IF parser_debugprint
                 print "shift %s"%repr(token)
@@ -141,27 +578,68 @@ class Parser(object):
                 state = self._shift[(state,token)]
                 read_next = True
                 count += 1
+                #@ IF parser_stats
+                if len(stack) > depth:
+                    depth = len(stack)
+                #@ ENDIF
+            #@ ENDIF
+            #@ IF integer_tables
+            elif action < 0:
+                X,n,j = self._rules[-action-1]
+            #@ ELSE
             elif (state,token) in self._reduce:
                 X,n = self._reduce[(state,token)]
-                if n > 0:
+            #@ ENDIF
+                #@ IF parser_stats
+                reductions[(X,n)] = reductions.get((X,n), 0) + 1
+                #@ ENDIF
+                if apply is not None:
+                    k = len(stack)-n
+                    if n > 0:
+                        state = stack[k][0]
+                    #@ IF parser_debugprint
+                    debug = [ s[1] for s in stack[k:] ]
+                    #@ ENDIF
+                    tree = apply(X, stack[k:])
+                    del stack[k:]
+                elif n > 0:
                     state = stack[-n][0]
+                    #@ IF parser_debugprint
+                    debug = [ s[1][0] for s in stack[-n:] ]
+                    #@ ENDIF
                     #@ IF transparent_tokens
-                    tree = [ X ]
-                    for s in stack[-n:]:
+                    # Nodes for transparent symbols are lists, which
+                    # are spliced into the parent node.  For left-
+                    # recursive rules like the ones generated for "*"
+                    # and "+", the list of the first child is extended
+                    # in place, so that long repetitions take linear
+                    # time.
+                    k = len(stack)-n
+                    tree = stack[k][1]
+                    if tree[0] == X and tree.__class__ is list:
+                        k += 1
+                    else:
+                        tree = [ X ]
+                    for s in stack[k:]:
                         if s[1][0] in self._transparent:
                             tree.extend(s[1][1:])
                         else:
                             tree.append(s[1])
-                    tree = tuple(tree)
+                    if X not in self._transparent:
+                        tree = tuple(tree)
                     #@ ELSE
                     tree = (X,) + tuple(s[1] for s in stack[-n:])
                     #@ ENDIF
-                    #@ IF parser_debugprint
-                    debug = [ s[1][0] for s in stack[-n:] ]
-                    #@ ENDIF
                     del stack[-n:]
                 else:
+                    #@ IF transparent_tokens
+                    if X in self._transparent:
+                        tree = [ X ]
+                    else:
+                        tree = (X,)
+                    #@ ELSE
                     tree = (X,)
+                    #@ ENDIF
                     #@ IF parser_debugprint
                     debug = [ ]
                     #@ ENDIF
@@ -169,19 +647,176 @@ class Parser(object):
                 print "reduce %s -> %s"%(repr(debug),repr(X))
                 #@ ENDIF
                 stack.append((state,tree))
+                #@ IF parser_stats
+                if len(stack) > depth:
+                    depth = len(stack)
+                #@ ENDIF
+                #@ IF integer_tables
+                #@ IF packed_tables
+                i = self._gbase[j] + state
+                if self._gcheck[i] == j:
+                    state = self._gnext[i]
+                else:
+                    state = self._gdefault[j]
+                #@ ELSE
+                state = self._goto[state][j]
+                #@ ENDIF
+                #@ ELSE
                 state = self._goto[(state,X)]
+                #@ ENDIF
             else:
                 #@ IF parser_debugprint
                 print "parse error"
                 #@ ENDIF
+                #@ IF parser_stats
+                self._record_stats(count, depth)
+                #@ ENDIF
                 return (False,count,state,lookahead)
+        #@ IF parser_stats
+        self._record_stats(count, depth)
+        #@ ENDIF
         return (True,count,state,None)
 
+    def reset_stats(self):
+        """Reset the counters in `self.stats`.
+
+        `self.stats` is a dictionary with the following entries:
+        "shifts" is the number of shifted tokens, "reductions" maps
+        pairs `(X, n)`, where `X` is a nonterminal and `n` is the
+        length of the right-hand side of a rule, to the number of
+        reductions using this rule, "max_depth" is the maximal
+        depth of the parser stack, "recoveries" is the number of
+        attempts to repair the input after a parse error,
+        "repairs_tried" is the number of candidate repairs which
+        were evaluated, and "recovery_time" is the time in seconds
+        spent on error recovery.  After a parse error, the shifts and
+        reductions are counted as if the repaired input had been
+        parsed, so that every token is counted once; the work of
+        evaluating the candidate repairs is only reflected in
+        "repairs_tried".
+        """
+        self.stats = { "shifts": 0, "reductions": {}, "max_depth": 0,
+                       "recoveries": 0, "repairs_tried": 0,
+                       "recovery_time": 0.0 }
+
+    def _record_stats(self, count, depth):
+        """Internal function to update `self.stats` after parsing."""
+        stats = self.stats
+        stats["shifts"] += count
+        stats["max_depth"] = depth
+
+    def _apply_action(self, X, entries):
+        """Internal function to compute the value of a reduction.
+
+        'X' is the nonterminal and 'entries' are the stack entries
+        for the right-hand side of the production rule.
+        """
+        values = self._Children()
+        for s in entries:
+            v = s[1]
+            if v.__class__ is self._Children:
+                if values:
+                    values.extend(v)
+                else:
+                    # nobody else refers to v, so it can be re-used
+                    values = v
+            else:
+                values.append(v)
+        #@ IF transparent_tokens
+        if X in self._transparent:
+            return values
+        #@ ENDIF
+        f = self._actions.get(X)
+        if f is None:
+            return (X,) + tuple(values)
+        return f(*values)
+
+    def _arena_reduce(self, X, entries):
+        """Internal function to add a node to the arena.
+
+        'X' is the nonterminal and 'entries' are the stack entries
+        for the right-hand side of the production rule.  The stack
+        holds node numbers, input tokens and, for transparent
+        symbols, lists of references which are spliced into the
+        parent.
+        """
+        arena = self._arena
+        refs = self._Children()
+        for s in entries:
+            v = s[1]
+            if v.__class__ is int:
+                refs.append(v)
+            elif v.__class__ is self._Children:
+                if refs:
+                    refs.extend(v)
+                else:
+                    # nobody else refers to v, so it can be re-used
+                    refs = v
+            else:
+                arena.tokens.append(v)
+                refs.append(-len(arena.tokens))
+        #@ IF transparent_tokens
+        if X in self._transparent:
+            return refs
+        #@ ENDIF
+        return arena._add(X, refs)
+
+    def _finish_tree(self, tree):
+        """Internal function to return the root of the parse tree."""
+        #@ IF parser_arena
+        arena = self._arena
+        if arena is not None:
+            self._arena = None
+            arena.root = tree
+            return arena
+        #@ ENDIF
+        return tree
+
     def _try_parse(self, tokens, stack, state):
+        """Internal function to check how much of the input can be parsed.
+
+        'Tokens' is a list of input tokens, 'stack' is a list of
+        states which is modified in place and 'state' is the initial
+        state of the automaton.  No parse tree is constructed.
+
+        Returns a tuple (count, state), where 'count' is the number of
+        tokens which could be shifted and 'state' is the final state.
+        """
         count = 0
         while state != self._halting_state and count < len(tokens):
             token = tokens[count][0]
 
+            #@ IF integer_tables
+            column = self._token_id.get(token, -1)
+            #@ IF packed_tables
+            i = self._base[state] + column
+            if self._check[i] == state:
+                action = self._next[i]
+            else:
+                action = self._default[state]
+            #@ ELSE
+            action = self._action[state][column]
+            #@ ENDIF
+            if action > 0:
+                stack.append(state)
+                state = action
+                count += 1
+            elif action < 0:
+                X,n,j = self._rules[-action-1]
+                if n > 0:
+                    state = stack[-n]
+                    del stack[-n:]
+                stack.append(state)
+                #@ IF packed_tables
+                i = self._gbase[j] + state
+                if self._gcheck[i] == j:
+                    state = self._gnext[i]
+                else:
+                    state = self._gdefault[j]
+                #@ ELSE
+                state = self._goto[state][j]
+                #@ ENDIF
+            #@ ELSE
             if (state,token) in self._shift:
                 stack.append(state)
                 state = self._shift[(state,token)]
@@ -193,9 +828,142 @@ class Parser(object):
                     del stack[-n:]
                 stack.append(state)
                 state = self._goto[(state,X)]
+            #@ ENDIF
             else:
                 break
-        return count
+        return count, state
+
+    def _add_error(self, errors, stack, state, lookahead):
+        """Record a parse error in the list `errors`.
+
+        'Stack' and 'state' describe the automaton at the time of the
+        error and 'lookahead' is the token which could not be parsed.
+        If the maximal number of errors is reached, a ParseErrors
+        exception is raised.
+        """
+        expect = list(self.expected(state))
+        #@ IF error_stacks
+        errors.append((lookahead, expect, [ s[1] for s in stack ]))
+        #@ ELSE
+        errors.append((lookahead, expect))
+        #@ ENDIF
+        if self.max_err is not None and len(errors) >= self.max_err:
+            raise self.ParseErrors(errors, None)
+
+    def _recover(self, stack, state, lookahead, tokens):
+        """Internal function to repair the input after a parse error.
+
+        'Stack' and 'state' describe the automaton at the time of the
+        error, 'lookahead' is the token which could not be parsed and
+        'tokens' is an iterator over the remaining input.  Up to
+        `errcorr_post` tokens are read from 'tokens'.
+
+        Returns a 3-tuple (stack, state, tokens) from which parsing
+        can be resumed, or None if no repair was found.
+        """
+        #@ IF parser_debugprint
+        print "backtrack for error recovery"
+        #@ ENDIF
+        #@ IF parser_stats
+        from time import time
+        t0 = time()
+        tried = 0
+        #@ ENDIF
+        queue = []
+        if self._actions is None:
+            #@ IF parser_arena
+            arena = self._arena
+            def leaves(v):
+                if arena is None:
+                    return self.leaves(v)
+                elif v.__class__ is int:
+                    return arena.leaves(v)
+                elif v.__class__ is self._Children:
+                    return chain(*[ arena.leaves(r) for r in v ])
+                else:
+                    return [ v ]
+            #@ ELSE
+            leaves = self.leaves
+            #@ ENDIF
+            def split_input(m, stack, lookahead, queue):
+                for s in stack:
+                    for t in leaves(s[1]):
+                        queue.append(t)
+                        if len(queue) > m:
+                            yield queue.pop(0)
+                queue.append(lookahead)
+            in2 = split_input(self.m, stack, lookahead, queue)
+            stack = []
+            #@ IF parser_stats
+            # The input is parsed again from the start, so the counts
+            # are reset to their values at the start of parsing.
+            shifts, reductions = self._stats_start
+            self.stats["shifts"] = shifts
+            self.stats["reductions"].clear()
+            self.stats["reductions"].update(reductions)
+            #@ ENDIF
+            done,_,state,lookahead = self._parse(in2, stack, 0)
+        else:
+            # The input cannot be reconstructed from semantic values,
+            # so only the invalid token itself can be repaired.
+            queue.append(lookahead)
+        m = len(queue)
+        for i in range(0, self.n):
+            try:
+                queue.append(tokens.next())
+            except StopIteration:
+                break
+
+        def vary_queue(queue, m):
+            for i in range(m-1, -1, -1):
+                # All candidates at position i share the first i tokens,
+                # so the automaton is only run once for them.  Only
+                # tokens which can be shifted at position i can improve
+                # on the original input.
+                stack0 = [ s[0] for s in stack ]
+                _,state0 = self._try_parse(queue[:i], stack0, state)
+                valid = [ t for t in self.terminals
+                          if self._try_parse([(t,)], stack0[:], state0)[0] ]
+                for t in valid:
+                    yield i, [(t,)]+queue[i:], stack0, state0
+                if queue[i][0] == self.EOF:
+                    continue
+                for t in valid:
+                    if t == queue[i][0]:
+                        continue
+                    yield i, [(t,)]+queue[i+1:], stack0, state0
+                yield i, queue[i+1:], stack0, state0
+        best_val = len(queue)-m+1
+        best_queue = queue
+        budget = self.budget
+        for i,tail,stack0,state0 in vary_queue(queue, m):
+            if budget is not None:
+                if budget <= 0:
+                    break
+                budget -= 1
+            #@ IF parser_stats
+            tried += 1
+            #@ ENDIF
+            pos,_ = self._try_parse(tail, stack0[:], state0)
+            val = len(tail) - pos
+            if val < best_val:
+                best_val = val
+                best_queue = queue[:i]+tail
+                if val == 0:
+                    break
+        #@ IF parser_stats
+        stats = self.stats
+        stats["recoveries"] += 1
+        stats["repairs_tried"] += tried
+        stats["recovery_time"] += time() - t0
+        #@ ENDIF
+        if best_val >= len(queue)-m+1:
+            return None
+        #@ IF parser_debugprint
+        debug = " ".join(repr(x[0]) for x in best_queue)
+        print "restart with repaired input: "+debug
+        #@ ENDIF
+        return (stack, state, chain(best_queue, tokens))
 
     def parse(self, tokens):
         """Parse the tokens from `tokens` and construct a parse tree.
@@ -208,6 +976,18 @@ class Parser(object):
         If `tokens` is invalid, a ParseErrors exception is raised.
         Otherwise the function returns the parse tree.
         """
+        #@ IF tables_file
+        if self._base is None:
+            self.load_tables()
+        #@ ENDIF
+        #@ IF parser_arena
+        if self._use_arena:
+            self._arena = Arena()
+        #@ ENDIF
+        #@ IF parser_stats
+        self._stats_start = (self.stats["shifts"],
+                             self.stats["reductions"].copy())
+        #@ ENDIF
         errors = []
         tokens = chain(tokens, [(self.EOF,)])
         stack = []
@@ -217,67 +997,156 @@ class Parser(object):
             if done:
                 break
 
-            expect = [ t for s,t in self._reduce.keys()+self._shift.keys()
-                       if s == state ]
-            #@ IF error_stacks
-            errors.append((lookahead, expect, [ s[1] for s in stack ]))
-            #@ ELSE
-            errors.append((lookahead, expect))
-            #@ ENDIF
-            if self.max_err is not None and len(errors) >= self.max_err:
+            self._add_error(errors, stack, state, lookahead)
+            res = self._recover(stack, state, lookahead, tokens)
+            if res is None:
                 raise self.ParseErrors(errors, None)
+            stack, state, tokens = res
 
-            #@ IF parser_debugprint
-            print "backtrack for error recovery"
-            #@ ENDIF
-            queue = []
-            def split_input(m, stack, lookahead, queue):
-                for s in stack:
-                    for t in self.leaves(s[1]):
-                        queue.append(t)
-                        if len(queue) > m:
-                            yield queue.pop(0)
-                queue.append(lookahead)
-            in2 = split_input(self.m, stack, lookahead, queue)
-            stack = []
-            done,_,state,lookahead = self._parse(in2, stack, 0)
-            m = len(queue)
-            for i in range(0, self.n):
-                try:
-                    queue.append(tokens.next())
-                except StopIteration:
-                    break
-
-            def vary_queue(queue, m):
-                for i in range(m-1, -1, -1):
-                    for t in self.terminals:
-                        yield queue[:i]+[(t,)]+queue[i:]
-                    if queue[i][0] == self.EOF:
-                        continue
-                    for t in self.terminals:
-                        if t == queue[i]:
-                            continue
-                        yield queue[:i]+[(t,)]+queue[i+1:]
-                    yield queue[:i]+queue[i+1:]
-            best_val = len(queue)-m+1
-            best_queue = queue
-            for q2 in vary_queue(queue, m):
-                pos = self._try_parse(q2, [ s[0] for s in stack ], state)
-                val = len(q2) - pos
-                if val < best_val:
-                    best_val = val
-                    best_queue = q2
-                    if val == len(q2):
-                        break
-            if best_val >= len(queue)-m+1:
-                raise self.ParseErrors(errors, None)
-            tokens = chain(best_queue, tokens)
-            #@ IF parser_debugprint
-            debug = " ".join(repr(x[0]) for x in best_queue)
-            print "restart with repaired input: "+debug
-            #@ ENDIF
-
-        tree = stack[0][1]
+        tree = self._finish_tree(stack[0][1])
         if errors:
             raise self.ParseErrors(errors, tree)
         return tree
+
+    def parse_many(self, inputs, workers=None, chunksize=None):
+        """Parse many independent inputs, using several processes.
+
+        `inputs` must be an iterable over inputs as for `parse`,
+        where each input must be a list or tuple of tokens (not an
+        iterator), so that it can be sent to a worker process.  The
+        return value is an iterator over the results, in the order of
+        the inputs: each result is either a parse tree or, if the
+        corresponding input is invalid, a ParseErrors instance.
+
+        `workers` gives the number of worker processes and defaults
+        to the number of CPUs.  Each worker creates one parser, with
+        the same constructor arguments as this instance.  For
+        `workers=1`, the inputs are parsed in the current process.
+        `chunksize` gives the number of inputs sent to a worker at a
+        time; larger values reduce the communication overhead for
+        small inputs.
+        """
+        #@ IF tables_file
+        if self._base is None:
+            self.load_tables()
+        #@ ENDIF
+        if workers is None:
+            from multiprocessing import cpu_count
+            workers = cpu_count()
+        if workers == 1:
+            for tokens in inputs:
+                try:
+                    yield self.parse(tokens)
+                except self.ParseErrors, e:
+                    yield e
+            return
+
+        if chunksize is None:
+            try:
+                chunksize = max(1, -(-len(inputs) // (4*workers)))
+            except TypeError:
+                chunksize = 32
+        from multiprocessing import Pool
+        kwargs = { "max_err": self.max_err, "errcorr_pre": self.m,
+                   "errcorr_post": self.n, "errcorr_budget": self.budget,
+                   "actions": self._actions, "arena": self._use_arena }
+        pool = Pool(workers, _parse_many_init, (self.__class__, kwargs))
+        done = False
+        try:
+            for ok, res in pool.imap(_parse_many_worker, inputs, chunksize):
+                if ok:
+                    yield res
+                    continue
+                errors = []
+                for err in res[0]:
+                    token = err[0]
+                    if token[0] is None:
+                        token = (self.EOF,)+token[1:]
+                    expect = [ self.EOF if X is None else X for X in err[1] ]
+                    errors.append((token, expect)+tuple(err[2:]))
+                yield self.ParseErrors(errors, res[1])
+            done = True
+        finally:
+            if done:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+
+    def feed(self, tokens):
+        """Parse a chunk of input incrementally.
+
+        `tokens` must be an iterable over tuples, in the same format
+        as for `parse`.  The tokens are parsed as far as possible and
+        the state of the parser is kept until more input is passed in
+        by further calls to `feed`.  The end of input is signalled by
+        calling `finish`, which returns the parse tree.
+
+        Parse errors are recorded as they are found, but since the
+        repair of the input needs to look `errcorr_post` tokens ahead,
+        the repair may be delayed until more input is available.  If
+        the maximal number of errors is reached or the input cannot be
+        repaired, a ParseErrors exception is raised and the parser
+        is reset.
+        """
+        self._push_parse(tokens, False)
+
+    def finish(self):
+        """Signal the end of input for incremental parsing.
+
+        This method completes parsing the input passed to `feed`.  If
+        the input is invalid, a ParseErrors exception is raised.
+        Otherwise the function returns the parse tree.  In either
+        case, the parser is reset and can be used for new input.
+        """
+        return self._push_parse([(self.EOF,)], True)
+
+    def _push_parse(self, tokens, final):
+        """Internal function to continue incremental parsing.
+
+        'Tokens' is the new input.  If 'final' is true, the input is
+        complete and the parse tree is returned.  Otherwise parsing
+        stops once the available input is consumed, and the state of
+        the parser is stored for the next call.
+        """
+        #@ IF tables_file
+        if self._base is None:
+            self.load_tables()
+        #@ ENDIF
+        if self._push is None:
+            stack, state, errors, lookahead, pending = [], 0, [], None, []
+            #@ IF parser_arena
+            if self._use_arena:
+                self._arena = Arena()
+            #@ ENDIF
+            #@ IF parser_stats
+            self._stats_start = (self.stats["shifts"],
+                                 self.stats["reductions"].copy())
+            #@ ENDIF
+        else:
+            stack, state, errors, lookahead, pending = self._push
+            self._push = None
+        pending.extend(tokens)
+        while True:
+            if lookahead is not None:
+                # a parse error is waiting to be repaired
+                if len(pending) < self.n and not final:
+                    break
+                res = self._recover(stack, state, lookahead,
+                                    iter(pending))
+                if res is None:
+                    raise self.ParseErrors(errors, None)
+                stack, state, tokens = res
+            else:
+                tokens = iter(pending)
+            done,_,state,lookahead = self._parse(tokens, stack, state)
+            pending = list(tokens)
+            if done:
+                tree = self._finish_tree(stack[0][1])
+                if errors:
+                    raise self.ParseErrors(errors, tree)
+                return tree
+            if lookahead is None:
+                break
+            self._add_error(errors, stack, state, lookahead)
+        self._push = (stack, state, errors, lookahead, pending)
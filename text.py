@@ -64,7 +64,9 @@ def write_block(fd, indent, str, params={}, first=False):
     If `first` is False, a leading empty line is added.
 
     Blocks between lines of the form '#@ IF cond' and '#@ ENDIF' are
-    removed if 'params[cond]' is not True.
+    removed if 'params[cond]' is not True.  An optional '#@ ELSE' line
+    inverts the condition for the rest of the block.  Blocks can be
+    nested.
     """
     lines = [l.rstrip().expandtabs() for l in str.splitlines()]
     while lines and not lines[0]:
@@ -77,18 +79,20 @@ def write_block(fd, indent, str, params={}, first=False):
     if not first:
         fd.write("\n")
     strip = min([len(l)-len(l.lstrip()) for l in lines if l!=""])
-    stack = [ True ]
+    stack = [ (True, True) ]
     for l in lines:
         l = l[strip:].rstrip()
         l0 = l.lstrip()
         if l0.startswith('#@'):
             token = l0[2:].split()
             if token[0] == "IF":
-                stack.append(params.get(token[1], False))
+                cond = bool(params.get(token[1], False))
+                stack.append((stack[-1][0] and cond, cond))
             elif token[0] == "ELSE":
-                stack[-1] = not stack[-1]
+                cond = not stack[-1][1]
+                stack[-1] = (stack[-2][0] and cond, cond)
             elif token[0] == "ENDIF":
                 stack.pop()
             continue
-        if stack[-1]:
+        if stack[-1][0]:
             fd.write((" "*indent+l).rstrip()+"\n")
@@ -20,19 +20,35 @@
 import sys
 # FIX PATH
 
-from os.path import basename
+from os import makedirs, stat
+from os.path import basename, dirname, isdir, join, relpath, splitext
 from optparse import OptionParser
+from StringIO import StringIO
+from time import sleep, time
+from traceback import print_exc
 
 from grammar import read_grammar
 from automaton import Automaton
-from helpers import open_executable
+from cache import TableCache
+from helpers import open_executable, Stats
 from version import VERSION
 
 ######################################################################
 # command line options
 
-getopt = OptionParser("usage: %prog [options] grammar")
+getopt = OptionParser("usage: %prog [options] grammar\n"
+                      "       %prog [options] --outdir=DIR grammar...")
 getopt.remove_option("-h")
+getopt.add_option("--actions", action="store_true", dest="actions_flag",
+                  help="allow the generated parser to compute values"
+                  " using semantic actions")
+getopt.add_option("--arena", action="store_true", dest="arena_flag",
+                  help="allow the generated parser to store parse trees"
+                  " in flat arrays")
+getopt.add_option("--cache-dir", action="store", dest="cache_dir",
+                  help="store cached parser tables in DIR"
+                  " (default: ~/.cache/wisent)",
+                  metavar="DIR")
 getopt.add_option("-d", "--debug", action="store", type="string",
                   dest="debug", default="",
                   help="enable debugging (p=parser)",
@@ -42,11 +58,49 @@ getopt.add_option("-e", "--example", action="store", dest="example_fname",
                   metavar="NAME")
 getopt.add_option("-h", "--help", action="store_true", dest="help_flag",
                   help="show this message")
+getopt.add_option("--instrument", action="store_true", dest="instrument_flag",
+                  help="count shifts, reductions and error recoveries"
+                  " in the generated parser")
+getopt.add_option("-j", "--jobs", action="store", type="int", dest="jobs",
+                  help="with --outdir, process N grammars in parallel"
+                  " (default: number of CPUs)",
+                  metavar="N")
+getopt.add_option("-m", "--method", action="store", type="choice",
+                  dest="method", default="lr1", choices=["lr1", "lalr"],
+                  help="parser construction method: lr1 or lalr"
+                  " (default: %default)",
+                  metavar="METHOD")
+getopt.add_option("--no-cache", action="store_false", dest="cache_flag",
+                  default=True,
+                  help="always generate the parser tables from scratch")
 getopt.add_option("-o", "--output", action="store", dest="output_fname",
                   help="set the output file name (default is stdout)",
                   metavar="NAME")
+getopt.add_option("--outdir", action="store", dest="outdir",
+                  help="store the parsers for all given grammars in DIR",
+                  metavar="DIR")
+getopt.add_option("--parse-many", action="store_true", dest="many_flag",
+                  help="add the method parse_many() to the generated"
+                  " parser")
 getopt.add_option("-r", "--replace", action="store_true", dest="replace_flag",
                   help="replace nonterminals by numbers")
+getopt.add_option("--stats", action="store", dest="stats_fname",
+                  help="store timings and statistics in JSON format"
+                  " into NAME",
+                  metavar="NAME")
+getopt.add_option("--tables", action="store", type="choice",
+                  dest="tables", default="dict",
+                  choices=["dict", "dense", "packed"],
+                  help="layout of the parser tables: dict, dense or packed"
+                  " (default: %default)",
+                  metavar="KIND")
+getopt.add_option("--tables-file", action="store", dest="tables_fname",
+                  help="store the parser tables in the binary file NAME"
+                  " (implies --tables=packed)",
+                  metavar="NAME")
+getopt.add_option("--watch", action="store_true", dest="watch_flag",
+                  help="regenerate the output whenever the grammar file"
+                  " changes")
 getopt.add_option("-V","--version",action="store_true",dest="version_flag",
                   help="show version information")
 (options,args)=getopt.parse_args()
@@ -72,71 +126,301 @@ params = {}
 
 progname = basename(sys.argv[0])
 
-if len(args) < 1:
+f_out = options.output_fname
+f_ex = options.example_fname
+f_tab = options.tables_fname
+f_stats = options.stats_fname
+
+if options.outdir is not None:
+    if not args:
+        getopt.error("--outdir requires at least one grammar file")
+    for opt, value in [ ("-o", f_out), ("-e", f_ex),
+                        ("--tables-file", f_tab), ("--stats", f_stats),
+                        ("--watch", options.watch_flag) ]:
+        if value is not None:
+            getopt.error("%s cannot be used together with --outdir"%opt)
+    outputs = {}
+    for fname in args:
+        name = splitext(basename(fname))[0] + ".py"
+        if name in outputs:
+            getopt.error('"%s" and "%s" would both be written to "%s"'%(
+                    outputs[name], fname, name))
+        outputs[name] = fname
+    f_in = None
+elif len(args) < 1:
     f_in = None
 elif len(args) > 1:
-    getopt.error("too many command line arguments")
+    getopt.error("too many command line arguments, use --outdir"
+                 " to process several grammars")
 else:
     f_in = args[0]
 
-f_out = options.output_fname
-f_ex = options.example_fname
+if options.watch_flag:
+    if f_in is None:
+        getopt.error("--watch requires a grammar file")
+    if f_out is None:
+        getopt.error("--watch requires -o")
 
 if "p" in options.debug:
     params["parser_comment"] = True
     params["parser_debugprint"] = True
 params["replace_nonterminals"] = options.replace_flag
+params["parser_stats"] = options.instrument_flag
+params["parser_many"] = options.many_flag
+params["parser_arena"] = options.arena_flag
+params["parser_actions"] = options.actions_flag
+params["method"] = options.method
+params["tables"] = options.tables
+if f_tab is not None:
+    if options.tables not in [ "dict", "packed" ]:
+        getopt.error("--tables-file requires --tables=packed")
+    if f_out is not None:
+        # the generated parser looks for the tables file relative
+        # to its own location
+        params["tables_file"] = relpath(f_tab, dirname(f_out) or ".")
+    else:
+        params["tables_file"] = f_tab
 
-######################################################################
-# read the grammar
-
-if f_in is None:
-    text = sys.stdin.read()
+if options.cache_flag and "parser_comment" not in params:
+    # the parser comments need the full automaton, so the cache is
+    # only used without debugging output
+    cache = TableCache(options.cache_dir)
 else:
-    params.setdefault("fname", f_in)
-    try:
-        fd = open(f_in, "rb")
-        text = fd.read()
-        fd.close()
-    except IOError, e:
-        msg = '%s: error while reading "%s": %s'%(f_in, f_in, e.strerror)
-        print >>sys.stderr, msg
-        raise SystemExit(1)
+    cache = None
 
 def check(g, params):
+    stats = params["stats"]
+    memo = params.get("memo")
     a = Automaton(g, params)
+    if cache is not None:
+        stats.start("cache")
+        key = a.cache_key()
+        if memo is not None and memo.get("tables", (None,))[0] == key:
+            data = memo["tables"][1]
+        else:
+            data = cache.get(key)
+            if memo is not None and data is not None:
+                memo["tables"] = (key, data)
+        stats.stop("cache")
+        stats.set("cache_hit", data is not None)
+        if data is not None:
+            a.load_cache_data(data)
+            return a
     a.check()
+    if cache is not None:
+        stats.start("cache")
+        data = a.cache_data()
+        cache.put(key, data)
+        stats.stop("cache")
+        if memo is not None:
+            memo["tables"] = (key, data)
     return a
 
-a = read_grammar(unicode(text, "utf-8").splitlines(), params, check)
-del text
+def generate(f_in, f_out, params):
+    """Read the grammar `f_in` and write the parser and all other output.
 
-######################################################################
-# emit the parser
+    `f_in` and `f_out` may be None to use stdin and stdout.  Errors
+    are reported on stderr and then SystemExit is raised.
+    """
+    start_time = time()
+    stats = params["stats"]
 
-if f_out is None:
-    a.write_parser(sys.stdout, params)
-else:
-    params.setdefault("parser_name", f_out)
+    ##################################################################
+    # read the grammar
+
+    if f_in is None:
+        text = sys.stdin.read()
+    else:
+        params.setdefault("fname", f_in)
+        try:
+            fd = open(f_in, "rb")
+            text = fd.read()
+            fd.close()
+        except IOError, e:
+            msg = '%s: error while reading "%s": %s'%(f_in, f_in, e.strerror)
+            print >>sys.stderr, msg
+            raise SystemExit(1)
+
+    a = read_grammar(unicode(text, "utf-8").splitlines(), params, check)
+    del text
+
+    ##################################################################
+    # emit the parser
+
+    stats.start("write_parser")
+    if f_out is None:
+        a.write_parser(sys.stdout, params)
+    else:
+        params.setdefault("parser_name", f_out)
+        try:
+            fd = open(f_out, "w")
+            a.write_parser(fd, params)
+            fd.close()
+        except IOError, e:
+            msg = '%s: error while writing "%s": %s'%(progname, f_out,
+                                                      e.strerror)
+            print >>sys.stderr, msg
+            raise SystemExit(1)
+    stats.stop("write_parser")
+
+    ##################################################################
+    # emit the binary tables file
+
+    if f_tab is not None:
+        stats.start("write_tables")
+        try:
+            fd = open(f_tab, "wb")
+            a.write_tables(fd)
+            fd.close()
+        except IOError, e:
+            msg = '%s: error while writing "%s": %s'%(progname, f_tab,
+                                                      e.strerror)
+            print >>sys.stderr, msg
+            raise SystemExit(1)
+        stats.stop("write_tables")
+
+    ##################################################################
+    # emit the example source code
+
+    if f_ex is not None:
+        params.setdefault("example_name", f_ex)
+        stats.start("write_example")
+        try:
+            fd = open_executable(f_ex, "w")
+            a.g.write_example(fd, params)
+            fd.close()
+        except IOError, e:
+            msg = '%s: error while writing "%s": %s'%(progname, f_ex,
+                                                      e.strerror)
+            print >>sys.stderr, msg
+            raise SystemExit(1)
+        stats.stop("write_example")
+
+    ##################################################################
+    # emit the statistics
+
+    if f_stats is not None:
+        info = {
+            "grammar": f_in,
+            "method": options.method,
+            "tables": "packed" if f_tab is not None else params["tables"],
+            "version": VERSION,
+            "time": round(time()-start_time, 6),
+        }
+        try:
+            fd = open(f_stats, "w")
+            stats.write_json(fd, info)
+            fd.close()
+        except IOError, e:
+            msg = '%s: error while writing "%s": %s'%(progname, f_stats,
+                                                      e.strerror)
+            print >>sys.stderr, msg
+            raise SystemExit(1)
+
+def generate_batch(f_in):
+    """Generate the parser for `f_in` in batch mode.
+
+    This is used by the worker processes for --outdir.  The return
+    value is a tuple, giving the grammar file name, the exit status
+    and all messages written to stderr, so that the messages for
+    different grammars are not mixed up.
+    """
+    f_out = join(options.outdir, splitext(basename(f_in))[0] + ".py")
+    stderr = sys.stderr
+    sys.stderr = StringIO()
     try:
-        fd = open(f_out, "w")
-        a.write_parser(fd, params)
-        fd.close()
-    except IOError, e:
-        msg = '%s: error while writing "%s": %s'%(progname, f_out, e.strerror)
-        print >>sys.stderr, msg
-        raise SystemExit(1)
+        try:
+            generate(f_in, f_out, dict(params, stats=Stats()))
+            status = 0
+        except SystemExit, e:
+            status = e.code
+        except Exception:
+            print >>sys.stderr, "%s: internal error"%f_in
+            print_exc()
+            status = 1
+        return f_in, status, sys.stderr.getvalue()
+    finally:
+        sys.stderr = stderr
+
+def watch(f_in, f_out, params):
+    """Regenerate the output whenever the grammar file `f_in` changes.
+
+    The file is polled twice a second.  Results for the unchanged
+    parts of the grammar are kept in memory between runs.  This
+    function only returns when interrupted by the user.
+    """
+    memo = {}
+    # differs from every file state, so that the first run happens at once
+    last = ()
+    try:
+        while True:
+            try:
+                st = stat(f_in)
+                current = (st.st_mtime, st.st_size)
+            except OSError:
+                current = None
+            if current != last:
+                last = current
+                t0 = time()
+                try:
+                    generate(f_in, f_out, dict(params, stats=Stats(),
+                                               memo=memo))
+                    msg = "%s: wrote %s (%.2fs)"%(f_in, f_out, time()-t0)
+                except SystemExit:
+                    msg = "%s: failed"%f_in
+                except Exception:
+                    print_exc()
+                    msg = "%s: failed"%f_in
+                print >>sys.stderr, msg + ", waiting for changes ..."
+            sleep(0.5)
+    except KeyboardInterrupt:
+        pass
 
 ######################################################################
-# emit the example source code
+# process the grammars
 
-if f_ex is not None:
-    params.setdefault("example_name", f_ex)
+if options.outdir is None:
+    # the statistics are cheap to collect, they are only written if
+    # --stats is given
+    params["stats"] = Stats()
+    if options.watch_flag:
+        watch(f_in, f_out, params)
+    else:
+        generate(f_in, f_out, params)
+    raise SystemExit(0)
+
+if not isdir(options.outdir):
     try:
-        fd = open_executable(f_ex, "w")
-        a.g.write_example(fd, params)
-        fd.close()
-    except IOError, e:
-        msg = '%s: error while writing "%s": %s'%(progname, f_ex, e.strerror)
+        makedirs(options.outdir)
+    except OSError, e:
+        msg = '%s: cannot create "%s": %s'%(progname, options.outdir,
+                                            e.strerror)
         print >>sys.stderr, msg
         raise SystemExit(1)
+
+jobs = options.jobs
+if jobs is None:
+    from multiprocessing import cpu_count
+    jobs = cpu_count()
+jobs = max(1, min(jobs, len(args)))
+if jobs == 1:
+    results = map(generate_batch, args)
+else:
+    from multiprocessing import Pool
+    pool = Pool(jobs)
+    results = pool.imap_unordered(generate_batch, args)
+
+failed = 0
+for fname, status, messages in results:
+    sys.stderr.write(messages)
+    if status:
+        if not messages:
+            print >>sys.stderr, "%s: failed"%fname
+        failed += 1
+if jobs > 1:
+    pool.close()
+    pool.join()
+if failed:
+    print >>sys.stderr, "%s: %d of %d grammars failed"%(progname, failed,
+                                                        len(args))
+    raise SystemExit(1)